@@ -1,7 +1,7 @@
 import sys
 
 from classes import input_class
-from functions import general, output, process
+from functions import fit, general, manifest, output, process, verify
 
 
 # ============================================================================================================ #
@@ -24,10 +24,18 @@ def main():
         general.read_command_line(sys.argv, inp)
 
         # Select and execute the appropriate task
-        if inp.raman:
+        if inp.fit_file:
+            fit.run(inp)
+        elif inp.raman:
             process.raman(inp)
+        elif inp.roa and inp.enantiomer:
+            process.enantiomers(inp)
         elif inp.roa:
             process.roa(inp)
+        elif inp.verify:
+            verify.run(inp)
+        elif inp.manifest:
+            manifest.run(inp)
 
     except Exception as e:
         output.error(f"An error occurred: {e}")
@@ -8,9 +8,11 @@ class input_class:
       Initializes all input parameters for Raman/ROA data extraction to their default values.
       """
 
-      # -- Raman or ROA?
+      # -- Raman, ROA, verification against the reference implementation or job manifest?
       self.raman = False
       self.roa = False
+      self.verify = False
+      self.manifest = False
 
       # -- Frequency range
       self.freq_min = 0.0
@@ -23,6 +25,27 @@ class input_class:
       self.norm = False # Normalize the data
       self.pol = ""
       self.incoming_field_ev = 0.0
+      self.enantiomer = False # ROA of an enantiomer pair from the original output only
+      self.plot_format = 'png'
+
+      # -- Broadening backend ('auto' selects it from the calibrated cost model)
+      self.conv_backend = 'auto'
+      self.n_threads = 0 # 0: every CPU available to the job
+
+      # -- Precision and memory budget
+      self.precision = 'float64' # 'float32': Kahan-compensated single-precision broadening
+      self.mem_budget = 0        # Bytes, 0: no limit
+      self.spill_dir = ""        # Where spectra beyond the budget are memory-mapped (default: temporary)
+
+      # -- Fit to an experimental spectrum
+      self.fit_file = ""
+      self.fit_starts = 8
+
+      # -- Verification tolerances and synthetic outputs
+      self.atol = 0.0
+      self.rtol = 1.0e-10
+      self.n_synthetic = 6
+      self.verify_seed = 0
 
 
       
@@ -1,3 +1,5 @@
+import os
+
 class parameters:
     """
     Stores and manages fixed parameters and constants for Raman/ROA data extraction.
@@ -14,3 +16,19 @@ class parameters:
         self.raman_first_line = ' Frequency (New) [cm-1] | Raman Int. [A^4/amu]'
         self.roa_first_line = ' Frequency (New) [cm-1] |      Delta(0)'
 
+        # -- Enantiomer pairs (sampled check of a supplied mirror-image output)
+        self.enantiomer_samples = 8         # Modes compared (half of them the strongest ones)
+        self.enantiomer_freq_tol = 0.5      # cm^{-1}
+        self.enantiomer_rel_tol = 0.05      # Max. |I_mirror + I| relative to the larger of the two
+
+        # -- Plots
+        self.plot_dpi = 300                 # Resolution of saved figures; traces are downsampled to its pixel columns
+
+        # -- Broadening backends
+        self.conv_block_elements = 2**21    # Max. (grid points x modes) evaluated at once (matrix backend)
+        self.conv_allow_approx = False      # Let the automatic selection pick the binned FFT backend
+        self.conv_min_chunk_points = 20000  # Min. grid points per thread when broadening in parallel
+        self.float32_rtol = 5.0e-7          # Tolerance (relative to the spectrum maximum) of -precision float32 in -w verify
+        self.conv_config_file = os.environ.get('RAMAN_ROA_CONFIG',
+                                               os.path.join(os.path.expanduser('~'), '.config', 'raman-roa', 'broadening.json'))
+
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+class spectrum_store:
+    """
+    Holds finished spectra within a memory budget. Spectra that do not fit are
+    written to .npy files and kept as read-only memory maps.
+    """
+
+    def __init__(self, mem_budget=0, spill_dir=""):
+        """
+        Initializes an empty store.
+
+        Args:
+            mem_budget (int): Bytes of spectra kept in memory (0: no limit, nothing is spilled).
+            spill_dir (str): Directory in which a private subdirectory for the spilled .npy
+                files is created (default: the system temporary directory). The subdirectory
+                is unique to this store and removed by close().
+        """
+
+        self.mem_budget = mem_budget
+        self.spill_dir = spill_dir
+        self.in_memory = 0   # Bytes of spectra held in memory
+        self.n_spilled = 0   # Number of spectra currently held on disk
+
+        self._spectra = {}
+        self._spill_path = ""  # Private subdirectory, created on the first spill
+        self._n_files = 0      # Spill files created so far (unique file names)
+
+    def add(self, key, spectrum):
+        """
+        Stores (or replaces) a spectrum, spilling it to disk if it does not fit in the budget.
+
+        Args:
+            key: Hashable identifier of the spectrum.
+            spectrum (numpy.ndarray): Spectrum to store.
+
+        Returns:
+            numpy.ndarray: The stored array (in memory or memory-mapped).
+        """
+
+        self.discard(key)
+        spectrum = np.asarray(spectrum)
+
+        if self.mem_budget <= 0 or self.in_memory + spectrum.nbytes <= self.mem_budget:
+            self.in_memory += spectrum.nbytes
+            self._spectra[key] = spectrum
+            return spectrum
+
+        if not self._spill_path:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            self._spill_path = tempfile.mkdtemp(prefix='raman-roa-', dir=self.spill_dir or None)
+
+        path = os.path.join(self._spill_path, f'spectrum_{self._n_files}.npy')
+        mapped = np.lib.format.open_memmap(path, mode='w+', dtype=spectrum.dtype, shape=spectrum.shape)
+        mapped[...] = spectrum
+        mapped.flush()
+        del mapped
+        self._n_files += 1
+        self.n_spilled += 1
+
+        self._spectra[key] = np.load(path, mmap_mode='r')
+        return self._spectra[key]
+
+    def discard(self, key):
+        """
+        Forgets a spectrum (if present), releasing its share of the memory budget
+        or deleting its spill file.
+
+        Args:
+            key: Identifier of the spectrum.
+        """
+
+        spectrum = self._spectra.pop(key, None)
+        if spectrum is None:
+            return
+        if isinstance(spectrum, np.memmap):
+            path = spectrum.filename
+            del spectrum
+            os.remove(path)
+            self.n_spilled -= 1
+        else:
+            self.in_memory -= spectrum.nbytes
+
+    def __getitem__(self, key):
+        return self._spectra[key]
+
+    def __contains__(self, key):
+        return key in self._spectra
+
+    def __len__(self):
+        return len(self._spectra)
+
+    def close(self):
+        """
+        Drops every spectrum and removes the spill subdirectory, if one was created.
+        """
+
+        self._spectra.clear()
+        self.in_memory = 0
+        self.n_spilled = 0
+        if self._spill_path:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = ""
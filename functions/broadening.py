@@ -0,0 +1,477 @@
+import json
+import math
+import os
+import time
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from functions import output
+
+# Broadening strategies available behind process.conv_stick
+BACKENDS = ('direct', 'fft', 'matrix')
+
+# Backends that can be evaluated independently on contiguous chunks of the grid
+CHUNKABLE_BACKENDS = ('direct', 'matrix')
+
+# Backends that support float32 accumulation (with Kahan compensation)
+COMPENSATED_BACKENDS = ('direct',)
+
+# Backends whose result only differs from 'direct' by floating-point rounding ('fft' bins sticks on the grid)
+EXACT_BACKENDS = ('direct', 'matrix')
+
+# Terms of the linear cost model: numpy calls, Lorentzian evaluations, per-spectrum multiply-adds
+COST_TERMS = ('calls', 'lorentzian_elements', 'spectrum_elements')
+
+# Problem sizes (grid points, modes, spectra) timed by the one-time calibration; the number
+# of spectra varies independently so that the per-spectrum term can be told apart
+CALIBRATION_SIZES = [(500, 20, 1), (2000, 60, 1), (4000, 150, 1), (8000, 40, 1),
+                     (2000, 60, 4), (4000, 150, 4), (1000, 30, 8), (2000, 60, 16)]
+
+_cost_model = None
+# =====================================================================================
+def lorentzian(freqs, freq_peak, fwhm):
+    """
+    Evaluates the (unit height) Lorentzian line shape used by all backends.
+
+    Args:
+        freqs (numpy.ndarray): Frequency values in cm^-1.
+        freq_peak (float or numpy.ndarray): Peak position(s) in cm^-1.
+        fwhm (float): Broadening parameter in cm^-1.
+
+    Returns:
+        numpy.ndarray: Line shape evaluated at freqs.
+    """
+    return fwhm / ((freqs - freq_peak)**2 + fwhm)
+# -------------------------------------------------------------------------------------
+def output_array(freqs, int_peaks, out=None, dtype=np.float64):
+    """
+    Returns a zeroed (n_points) or (n_points, n_spectra) array, reusing out if given.
+
+    Args:
+        freqs (numpy.ndarray): Frequency grid (n_points).
+        int_peaks (numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        out (numpy.ndarray): Optional preallocated output (e.g. a chunk of a larger array).
+        dtype (numpy.dtype): Floating-point type of a newly allocated output.
+
+    Returns:
+        numpy.ndarray: Zeroed output array.
+    """
+    if out is None:
+        return np.zeros((len(freqs),) + int_peaks.shape[1:], dtype=dtype)
+    out[...] = 0.0
+    return out
+# -------------------------------------------------------------------------------------
+def kahan_add(total, compensation, term):
+    """
+    Compensated (Kahan) in-place summation total += term, without temporaries.
+    compensation holds the negated running rounding error; term is overwritten.
+
+    Args:
+        total (numpy.ndarray): Running sum.
+        compensation (numpy.ndarray): Running compensation, same shape as total.
+        term (numpy.ndarray): Term to add.
+
+    Returns:
+        None
+    """
+    term += compensation          # y = term - c
+    compensation[...] = total
+    total += term                 # t = total + y
+    compensation -= total
+    compensation += term          # -c = (total - t) + y
+# -------------------------------------------------------------------------------------
+def line_shape(freqs, freq_peak, fwhm, dtype):
+    """
+    Lorentzian evaluated in double precision and rounded to dtype. Rounding the
+    grid and the peak positions first would shift them by up to ~1e-4 cm^-1 and
+    dominate the float32 error.
+
+    Args:
+        freqs (numpy.ndarray): Frequency values in cm^-1 (float64).
+        freq_peak (float): Peak position in cm^-1.
+        fwhm (float): Broadening parameter in cm^-1.
+        dtype (numpy.dtype): Precision of the result.
+
+    Returns:
+        numpy.ndarray: Line shape at freqs.
+    """
+    return lorentzian(freqs, freq_peak, fwhm).astype(dtype, copy=False)
+# -------------------------------------------------------------------------------------
+def available_threads():
+    """
+    Number of CPUs this process may run on (respects the CPU affinity of the job).
+
+    Returns:
+        int: Number of usable CPUs.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+# =====================================================================================
+def conv_direct(freqs, freq_peaks, int_peaks, fwhm, out=None, dtype=np.float64, **kwargs):
+    """
+    Reference broadening: accumulates one full-grid Lorentzian per mode.
+
+    Args:
+        freqs (numpy.ndarray): Frequency grid (n_points).
+        freq_peaks (numpy.ndarray): Peak positions (n_modes).
+        int_peaks (numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        fwhm (float): Broadening parameter in cm^-1.
+        out (numpy.ndarray): Optional preallocated output.
+        dtype (numpy.dtype): Output precision; below float64 the sum is Kahan-compensated.
+
+    Returns:
+        numpy.ndarray: Broadened spectrum, (n_points) or (n_points, n_spectra).
+    """
+    spectrum = output_array(freqs, int_peaks, out, dtype)
+    if spectrum.dtype != np.float64:
+        int_peaks = int_peaks.astype(spectrum.dtype)
+        compensation = np.zeros_like(spectrum)
+        for peak in range(len(freq_peaks)):
+            shape = line_shape(freqs, freq_peaks[peak], fwhm, spectrum.dtype)
+            if int_peaks.ndim > 1:
+                shape = shape[:, None]
+            kahan_add(spectrum, compensation, shape * int_peaks[peak])
+    elif int_peaks.ndim == 1:
+        for peak in range(len(freq_peaks)):
+            spectrum += lorentzian(freqs, freq_peaks[peak], fwhm) * int_peaks[peak]
+    else:
+        for peak in range(len(freq_peaks)):
+            spectrum += lorentzian(freqs, freq_peaks[peak], fwhm)[:, None] * int_peaks[peak]
+    return spectrum
+# -------------------------------------------------------------------------------------
+def conv_matrix(freqs, freq_peaks, int_peaks, fwhm, block_elements=2**21, out=None, **kwargs):
+    """
+    Batched broadening: builds the (grid points x modes) Lorentzian matrix in row blocks
+    and contracts it with all spectra at once.
+
+    Args:
+        freqs (numpy.ndarray): Frequency grid (n_points).
+        freq_peaks (numpy.ndarray): Peak positions (n_modes).
+        int_peaks (numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        fwhm (float): Broadening parameter in cm^-1.
+        block_elements (int): Maximum size of the Lorentzian matrix held in memory.
+        out (numpy.ndarray): Optional preallocated output.
+
+    Returns:
+        numpy.ndarray: Broadened spectrum, (n_points) or (n_points, n_spectra).
+    """
+    n_points = len(freqs)
+    spectrum = output_array(freqs, int_peaks, out)
+    if len(freq_peaks) == 0:
+        return spectrum
+
+    block = max(1, block_elements // len(freq_peaks))
+    for start in range(0, n_points, block):
+        stop = min(start + block, n_points)
+        shapes = lorentzian(freqs[start:stop, None], freq_peaks[None, :], fwhm)
+        spectrum[start:stop] = shapes @ int_peaks
+    return spectrum
+# -------------------------------------------------------------------------------------
+def conv_fft(freqs, freq_peaks, int_peaks, fwhm, **kwargs):
+    """
+    Binned FFT broadening: sticks are distributed on a uniform grid (linear weights)
+    and convolved with the sampled Lorentzian. Approximate: the binning error scales
+    with (grid spacing / line width)^2.
+
+    Args:
+        freqs (numpy.ndarray): Uniform ascending frequency grid (n_points).
+        freq_peaks (numpy.ndarray): Peak positions (n_modes).
+        int_peaks (numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        fwhm (float): Broadening parameter in cm^-1.
+
+    Returns:
+        numpy.ndarray: Broadened spectrum, (n_points) or (n_points, n_spectra).
+    """
+    n_points = len(freqs)
+    if n_points < 2 or len(freq_peaks) == 0:
+        return conv_direct(freqs, freq_peaks, int_peaks, fwhm)
+
+    step = (freqs[-1] - freqs[0]) / (n_points - 1)
+
+    # Extend the binning grid so that sticks outside the window still contribute tails
+    first = min(0, int(math.floor((freq_peaks.min() - freqs[0]) / step)))
+    last = max(n_points - 1, int(math.ceil((freq_peaks.max() - freqs[0]) / step)) + 1)
+    n_bins = last - first + 1
+
+    pos = (freq_peaks - freqs[0]) / step - first
+    left = np.floor(pos).astype(int)
+    weight_right = pos - left
+    ints = int_peaks.reshape(len(freq_peaks), -1)
+
+    sticks = np.zeros((n_bins, ints.shape[1]))
+    np.add.at(sticks, left, ints * (1.0 - weight_right)[:, None])
+    np.add.at(sticks, np.minimum(left + 1, n_bins - 1), ints * weight_right[:, None])
+
+    # Linear (non-circular) convolution with the kernel sampled at all bin offsets
+    offsets = np.arange(-(n_bins - 1), n_bins) * step
+    kernel = lorentzian(offsets, 0.0, fwhm)
+    n_fft = 1 << (len(kernel) + n_bins - 2).bit_length()
+    conv = np.fft.irfft(np.fft.rfft(sticks, n_fft, axis=0) * np.fft.rfft(kernel, n_fft)[:, None], n_fft, axis=0)
+
+    spectrum = conv[n_bins - 1 - first : n_bins - 1 - first + n_points]
+    return spectrum.reshape((n_points,) + int_peaks.shape[1:])
+# =====================================================================================
+CONV_FUNCTIONS = {
+    'direct': conv_direct,
+    'fft':    conv_fft,
+    'matrix': conv_matrix,
+}
+# -------------------------------------------------------------------------------------
+def work_terms(backend, n_points, n_modes, n_spectra, block_elements):
+    """
+    Returns the work counts (see COST_TERMS) that drive the cost of a backend:
+    numpy calls, Lorentzian line-shape evaluations and per-spectrum multiply-adds
+    (element-wise updates for 'direct', a GEMM for 'matrix').
+
+    Args:
+        backend (str): Backend name.
+        n_points (int): Number of grid points.
+        n_modes (int): Number of vibrational modes.
+        n_spectra (int): Number of spectra broadened together.
+        block_elements (int): Block size of the matrix backend.
+
+    Returns:
+        tuple: (calls, lorentzian_elements, spectrum_elements) as floats.
+    """
+    if backend == 'direct':
+        return n_modes, n_modes * n_points, n_modes * n_points * n_spectra
+    if backend == 'matrix':
+        calls = math.ceil(n_modes * n_points / block_elements)
+        return calls, n_modes * n_points, n_modes * n_points * n_spectra
+    # fft: the transforms play the role of the per-spectrum work
+    n_fft = 4 * max(n_points, 2)
+    return n_spectra, n_fft, n_spectra * n_fft * math.log2(n_fft) + n_modes * n_spectra
+# -------------------------------------------------------------------------------------
+def fit_non_negative(rows, times):
+    """
+    Non-negative least squares for the few terms of the cost model, by trying every
+    subset of terms and keeping the best fit whose coefficients are all non-negative.
+
+    Args:
+        rows (numpy.ndarray): (n_sizes x n_terms) work counts.
+        times (numpy.ndarray): Measured times (n_sizes).
+
+    Returns:
+        numpy.ndarray: Non-negative coefficients (n_terms).
+    """
+    # Relative residuals: small and large problems weigh alike
+    rows = rows / times[:, None]
+    target = np.ones(len(times))
+    n_terms = rows.shape[1]
+    best, best_residual = np.zeros(n_terms), float('inf')
+    for subset in range(1, 1 << n_terms):
+        keep = [k for k in range(n_terms) if subset >> k & 1]
+        coef = np.linalg.lstsq(rows[:, keep], target, rcond=None)[0]
+        if np.any(coef < 0):
+            continue
+        residual = float(np.sum((rows[:, keep] @ coef - target)**2))
+        if residual < best_residual:
+            best, best_residual = np.zeros(n_terms), residual
+            best[keep] = coef
+    return best
+# -------------------------------------------------------------------------------------
+def calibrate(fwhm, block_elements, repeats=3):
+    """
+    Times every backend on a few small synthetic problems and fits a non-negative
+    linear cost model time = sum_k c_k * work_terms[k] per backend.
+
+    Args:
+        fwhm (float): Broadening parameter in cm^-1.
+        block_elements (int): Block size of the matrix backend.
+        repeats (int): Number of timings per size (the minimum is kept).
+
+    Returns:
+        dict: Backend name -> coefficients of COST_TERMS in seconds.
+    """
+    rng = np.random.default_rng(0)
+    coefficients = {}
+    for backend in BACKENDS:
+        rows, times = [], []
+        for n_points, n_modes, n_spectra in CALIBRATION_SIZES:
+            freqs = np.linspace(0.0, float(n_points), n_points)
+            freq_peaks = rng.uniform(0.0, n_points, n_modes)
+            int_peaks = rng.standard_normal((n_modes, n_spectra)) if n_spectra > 1 else rng.standard_normal(n_modes)
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                CONV_FUNCTIONS[backend](freqs, freq_peaks, int_peaks, fwhm, block_elements=block_elements)
+                best = min(best, time.perf_counter() - start)
+            rows.append(work_terms(backend, n_points, n_modes, n_spectra, block_elements))
+            times.append(best)
+        coef = fit_non_negative(np.array(rows, dtype=float), np.array(times))
+        coefficients[backend] = [float(c) for c in coef]
+    return coefficients
+# -------------------------------------------------------------------------------------
+def load_cost_model(param):
+    """
+    Loads the calibrated cost model, running the micro-benchmark and storing the
+    result in parameters.conv_config_file the first time.
+
+    Args:
+        param (parameters): Fixed parameters (fwhm, matrix block size, config path).
+
+    Returns:
+        dict: Backend name -> coefficients of COST_TERMS in seconds.
+    """
+    global _cost_model
+    if _cost_model is not None:
+        return _cost_model
+
+    try:
+        with open(param.conv_config_file, 'r') as f:
+            stored = json.load(f)
+        # Files written by an older cost model (other backends or terms) are recalibrated
+        if (set(stored.get('coefficients', {})) == set(BACKENDS) and
+                all(len(coef) == len(COST_TERMS) for coef in stored['coefficients'].values())):
+            _cost_model = stored['coefficients']
+            return _cost_model
+    except (OSError, ValueError):
+        pass
+
+    print('   Calibrating the broadening backends (one-time micro-benchmark)...')
+    _cost_model = calibrate(param.fwhm, param.conv_block_elements)
+    try:
+        os.makedirs(os.path.dirname(param.conv_config_file), exist_ok=True)
+        with open(param.conv_config_file, 'w') as f:
+            json.dump({'coefficients': _cost_model}, f, indent=2)
+        print(f'   Cost model saved to {param.conv_config_file} (delete it to recalibrate)')
+    except OSError:
+        print(f'   Cost model could not be saved to {param.conv_config_file}; it is kept for this run only')
+    return _cost_model
+# -------------------------------------------------------------------------------------
+def select_backend(freqs, freq_peaks, int_peaks, param, n_chunks=1, compensated=False):
+    """
+    Chooses the cheapest backend for a given problem shape from the cost model.
+
+    Args:
+        freqs (numpy.ndarray): Frequency grid.
+        freq_peaks (numpy.ndarray): Peak positions.
+        int_peaks (numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        param (parameters): Fixed parameters.
+        n_chunks (int): Number of grid chunks evaluated in parallel by chunkable backends.
+        compensated (bool): Only consider backends supporting compensated float32 sums.
+
+    Returns:
+        str: Name of the selected backend.
+    """
+    model = load_cost_model(param)
+    n_points = len(freqs)
+    n_modes = len(freq_peaks)
+    n_spectra = int_peaks.shape[1] if int_peaks.ndim > 1 else 1
+
+    candidates = BACKENDS if param.conv_allow_approx else EXACT_BACKENDS
+    if compensated:
+        candidates = [backend for backend in candidates if backend in COMPENSATED_BACKENDS]
+    costs = {}
+    for backend in candidates:
+        terms = work_terms(backend, n_points, n_modes, n_spectra, param.conv_block_elements)
+        costs[backend] = float(np.dot(model[backend], terms))
+        if backend in CHUNKABLE_BACKENDS:
+            costs[backend] /= n_chunks
+    return min(costs, key=costs.get)
+# -------------------------------------------------------------------------------------
+def grid_chunks(n_points, n_threads, min_points):
+    """
+    Splits the frequency grid into contiguous chunks, one per thread.
+
+    Args:
+        n_points (int): Number of grid points.
+        n_threads (int): Number of threads available.
+        min_points (int): Minimum number of grid points per chunk.
+
+    Returns:
+        list: (start, stop) index pairs covering the grid.
+    """
+    n_chunks = max(1, min(n_threads, n_points // max(1, min_points)))
+    bounds = np.linspace(0, n_points, n_chunks + 1).astype(int)
+    return [(int(bounds[k]), int(bounds[k + 1])) for k in range(n_chunks)]
+# -------------------------------------------------------------------------------------
+def broaden(freqs, freq_peaks, int_peaks, param, backend='auto', n_threads=1, log=True,
+            dtype=np.float64, mem_budget=0):
+    """
+    Convolves stick spectra with a Lorentzian, dispatching to the requested backend
+    or, for backend='auto', to the fastest one according to the calibrated cost model.
+
+    For n_threads > 1 the grid is split into contiguous chunks that are broadened on a
+    thread pool (NumPy releases the GIL in its kernels), each thread writing directly
+    into its slice of a single preallocated output array.
+
+    With dtype=float32 the sums are Kahan-compensated (direct backend only).
+    A memory budget caps the size of the intermediate arrays held by all threads.
+
+    Args:
+        freqs (numpy.ndarray): Frequency grid.
+        freq_peaks (list or numpy.ndarray): Peak positions in cm^-1.
+        int_peaks (list or numpy.ndarray): Intensities (n_modes) or (n_modes, n_spectra).
+        param (parameters): Fixed parameters.
+        backend (str): 'auto' or one of BACKENDS.
+        n_threads (int): Number of threads (0 uses every CPU in the affinity mask).
+        log (bool): Print the selected backend and number of threads.
+        dtype (numpy.dtype): Precision of the result (float64 or float32).
+        mem_budget (int): Bytes available for intermediates (0: parameters.conv_block_elements).
+
+    Returns:
+        numpy.ndarray: Broadened spectrum, (n_points) or (n_points, n_spectra).
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    freq_peaks = np.asarray(freq_peaks, dtype=float)
+    int_peaks = np.asarray(int_peaks, dtype=float)
+
+    if n_threads <= 0:
+        n_threads = available_threads()
+    chunks = grid_chunks(len(freqs), n_threads, param.conv_min_chunk_points)
+
+    dtype = np.dtype(dtype)
+    compensated = dtype != np.float64
+
+    auto = backend == 'auto'
+    if auto:
+        backend = select_backend(freqs, freq_peaks, int_peaks, param, n_chunks=len(chunks), compensated=compensated)
+    elif backend not in CONV_FUNCTIONS:
+        output.error(f'broadening backend "{backend}" not supported')
+    elif compensated and backend not in COMPENSATED_BACKENDS:
+        output.error(f'{dtype.name} precision requires one of the {", ".join(COMPENSATED_BACKENDS)} backends')
+    if backend not in CHUNKABLE_BACKENDS:
+        chunks = [(0, len(freqs))]
+
+    if log and (auto or len(chunks) > 1):
+        print(f'   Broadening backend: {backend}{" (auto)" if auto else ""}, {len(chunks)} thread(s)')
+
+    conv = CONV_FUNCTIONS[backend]
+    block_elements = param.conv_block_elements
+    if mem_budget > 0:
+        block_elements = min(block_elements, mem_budget // (3 * dtype.itemsize))
+    kwargs = {'block_elements': max(1, block_elements // len(chunks)), 'dtype': dtype}
+    if len(chunks) == 1:
+        return conv(freqs, freq_peaks, int_peaks, param.fwhm, **kwargs)
+
+    spectrum = np.empty((len(freqs),) + int_peaks.shape[1:], dtype=dtype)
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        jobs = [pool.submit(conv, freqs[start:stop], freq_peaks, int_peaks, param.fwhm,
+                            out=spectrum[start:stop], **kwargs) for start, stop in chunks]
+        for job in jobs:
+            job.result()
+    return spectrum
+# -------------------------------------------------------------------------------------
+def spectra_per_batch(n_points, n_spectra, dtype=np.float64, mem_budget=0):
+    """
+    Number of spectra that can be broadened together within a memory budget
+    (output, compensation and one temporary per spectrum).
+
+    Args:
+        n_points (int): Number of grid points.
+        n_spectra (int): Number of spectra to broaden.
+        dtype (numpy.dtype): Precision of the spectra.
+        mem_budget (int): Bytes available (0: no limit).
+
+    Returns:
+        int: Batch size, at least 1.
+    """
+    if mem_budget <= 0:
+        return max(1, n_spectra)
+    per_spectrum = 3 * max(1, n_points) * np.dtype(dtype).itemsize
+    return max(1, min(n_spectra, mem_budget // per_spectrum))
+# -------------------------------------------------------------------------------------
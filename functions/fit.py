@@ -0,0 +1,195 @@
+import os
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from classes import parameters
+from functions import broadening, general, output, process
+
+param = parameters.parameters()
+
+# Fitted parameters: Lorentzian width (same meaning as parameters.fwhm), frequency scale factor, intensity scale
+FIT_PARAMETERS = ('fwhm', 'scale', 'amplitude')
+# =====================================================================================
+def load_experimental(exp_file, freq_min, freq_max):
+    """
+    Loads a measured spectrum (two columns: wavenumber, intensity; comma or
+    whitespace separated, non-numeric header lines are skipped) within a window.
+
+    Args:
+        exp_file (str): Path to the experimental spectrum.
+        freq_min (float): Minimum frequency in cm^-1.
+        freq_max (float): Maximum frequency in cm^-1.
+
+    Returns:
+        tuple: (x, y) numpy arrays sorted by wavenumber.
+    """
+    x, y = [], []
+    with general.open_ams_file(exp_file) as f:
+        for line in f:
+            parts = line.replace(',', ' ').replace(';', ' ').split()
+            if len(parts) < 2:
+                continue
+            try:
+                x.append(float(parts[0]))
+                y.append(float(parts[1]))
+            except ValueError:
+                continue
+
+    x, y = np.array(x), np.array(y)
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    inside = (x >= freq_min) & (x <= freq_max)
+    if np.count_nonzero(inside) < len(FIT_PARAMETERS):
+        output.error(f'not enough points of "{exp_file}" between {freq_min} and {freq_max} cm^-1')
+    return x[inside], y[inside]
+# -------------------------------------------------------------------------------------
+def model(x, freq_cm, int_peaks, p, jacobian=False):
+    """
+    Broadened spectrum amplitude * sum_k I_k * w / ((x - scale * f_k)^2 + w) and,
+    optionally, its analytic derivatives with respect to (w, scale, amplitude).
+
+    Args:
+        x (numpy.ndarray): Wavenumbers at which the model is evaluated.
+        freq_cm (numpy.ndarray): Stick frequencies in cm^-1.
+        int_peaks (numpy.ndarray): Stick intensities.
+        p (numpy.ndarray): Parameters (fwhm, scale, amplitude).
+        jacobian (bool): Also return the (n_points x 3) Jacobian.
+
+    Returns:
+        numpy.ndarray or tuple: Model values, plus the Jacobian if requested.
+    """
+    w, scale, amplitude = p
+    d = x[:, None] - scale * freq_cm[None, :]
+    den = d**2 + w
+    shapes = w / den
+    unit = shapes @ int_peaks
+    if not jacobian:
+        return amplitude * unit
+
+    weighted = int_peaks / den**2          # I_k / (d^2 + w)^2
+    jac = np.empty((len(x), 3))
+    jac[:, 0] = amplitude * np.sum(d**2 * weighted, axis=1)
+    jac[:, 1] = amplitude * 2.0 * w * np.sum(d * weighted * freq_cm[None, :], axis=1)
+    jac[:, 2] = unit
+    return amplitude * unit, jac
+# -------------------------------------------------------------------------------------
+def fit_spectrum(x, y, freq_cm, int_peaks, w0, scale0, max_iter=200, tol=1.0e-12):
+    """
+    Levenberg-Marquardt least-squares fit of (fwhm, scale, amplitude) from one start.
+    The starting amplitude is the linear least-squares one for (w0, scale0).
+
+    Args:
+        x (numpy.ndarray): Experimental wavenumbers.
+        y (numpy.ndarray): Experimental intensities.
+        freq_cm (numpy.ndarray): Stick frequencies in cm^-1.
+        int_peaks (numpy.ndarray): Stick intensities.
+        w0 (float): Starting width.
+        scale0 (float): Starting frequency scale factor.
+        max_iter (int): Maximum number of iterations.
+        tol (float): Relative decrease of the cost below which the fit has converged.
+
+    Returns:
+        dict: 'p' (fitted parameters), 'cost' (0.5 * sum of squared residuals), 'n_iter'.
+    """
+    unit = model(x, freq_cm, int_peaks, (w0, scale0, 1.0))
+    norm = np.dot(unit, unit)
+    p = np.array([w0, scale0, np.dot(unit, y) / norm if norm > 0 else 1.0])
+
+    values, jac = model(x, freq_cm, int_peaks, p, jacobian=True)
+    residual = values - y
+    cost = 0.5 * np.dot(residual, residual)
+    damping = 1.0e-3
+
+    for n_iter in range(1, max_iter + 1):
+        # Marquardt step in parameters scaled by the Jacobian column norms
+        # (the amplitude and the width differ by many orders of magnitude)
+        norms = np.sqrt(np.sum(jac**2, axis=0))
+        norms[norms == 0] = 1.0
+        scaled_jac = jac / norms
+        hessian = scaled_jac.T @ scaled_jac + damping * np.eye(3)
+        step = np.linalg.solve(hessian, -(scaled_jac.T @ residual)) / norms
+        trial = p + step
+
+        if trial[0] > 0 and trial[1] > 0:
+            trial_values, trial_jac = model(x, freq_cm, int_peaks, trial, jacobian=True)
+            trial_residual = trial_values - y
+            trial_cost = 0.5 * np.dot(trial_residual, trial_residual)
+            if trial_cost < cost:
+                converged = cost - trial_cost <= tol * cost
+                p, jac, residual, cost = trial, trial_jac, trial_residual, trial_cost
+                damping = max(damping / 10.0, 1.0e-12)
+                if converged:
+                    break
+                continue
+
+        damping *= 10.0
+        if damping > 1.0e12:
+            break
+
+    return {'p': p, 'cost': cost, 'n_iter': n_iter}
+# -------------------------------------------------------------------------------------
+def start_points(n_starts, seed=0):
+    """
+    Starting (fwhm, scale) pairs: the default parameters first, then random
+    widths (log-uniform within a factor 10) and scale factors within 10 %.
+
+    Args:
+        n_starts (int): Number of starting points.
+        seed (int): Random seed.
+
+    Returns:
+        list of tuple: (fwhm, scale) pairs.
+    """
+    rng = np.random.default_rng(seed)
+    starts = [(param.fwhm, 1.0)]
+    for _ in range(n_starts - 1):
+        starts.append((param.fwhm * 10.0**rng.uniform(-1.0, 1.0), rng.uniform(0.9, 1.1)))
+    return starts
+# =====================================================================================
+def run(inp):
+    """
+    Fits the linewidth, a frequency scale factor and the intensity scale of the
+    computed Raman/ROA spectra to a measured one. Multi-start fits of all input
+    files run in parallel on a thread pool. The fitted spectra are saved to CSV files.
+
+    Args:
+        inp (input_class): Input parameters; inp.fit_file is the experimental spectrum.
+
+    Returns:
+        None
+    """
+    x, y = load_experimental(inp.fit_file, inp.freq_min, inp.freq_max)
+    ams_files = [inp.ams_file] if inp.raman else list(inp.ams_file)
+
+    # Sticks of every file (intensity-corrected, as for the regular spectra)
+    sticks = []
+    for ams_file in ams_files:
+        tables = process.read_ams_tables(ams_file)
+        freq_cm, ints = tables['raman'] if inp.raman else (tables['roa'][0], tables['roa'][1][inp.pol])
+        if len(freq_cm) == 0:
+            output.error(f'no {"Raman" if inp.raman else "ROA"} data found in "{ams_file}"')
+        ints = process.correct_intensities(freq_cm, ints, inp.incoming_field_ev)
+        sticks.append((np.array(freq_cm), np.array(ints)))
+
+    n_threads = inp.n_threads if inp.n_threads > 0 else broadening.available_threads()
+    tasks = [(n, w0, scale0) for n in range(len(ams_files)) for w0, scale0 in start_points(inp.fit_starts)]
+    with ThreadPoolExecutor(max_workers=max(1, min(n_threads, len(tasks)))) as pool:
+        fits = list(pool.map(lambda task: (task[0], fit_spectrum(x, y, *sticks[task[0]], task[1], task[2])), tasks))
+
+    print('')
+    print(f'   {"File":<32} {"fwhm":>10} {"scale":>10} {"amplitude":>12} {"rms":>12}')
+    print('   ' + '-' * 80)
+    for n, ams_file in enumerate(ams_files):
+        best = min((fit for m, fit in fits if m == n), key=lambda fit: fit['cost'])
+        w, scale, amplitude = best['p']
+        rms = np.sqrt(2.0 * best['cost'] / len(x))
+        print(f'   {os.path.basename(ams_file):<32} {w:10.3f} {scale:10.5f} {amplitude:12.4e} {rms:12.4e}')
+
+        if inp.raman:
+            output_csv = process.raman_csv_name(ams_file, label='FIT')
+        else:
+            output_csv = process.roa_csv_name(ams_file, inp.pol, label='FIT')
+        process.save_spectrum(output_csv, x, model(x, *sticks[n], best['p']))
+    print('')
+# -------------------------------------------------------------------------------------
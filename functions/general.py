@@ -1,4 +1,7 @@
 import argparse
+import gzip
+import io
+import lzma
 import sys
 import os
 
@@ -16,38 +19,100 @@ def read_command_line(argv, inp):
     """
 
     parser = argparse.ArgumentParser(description="Raman/ROA Data Extraction")
-    parser.add_argument('-w', choices=['raman', 'roa'], required=True, help="Type of analysis: raman or roa")
-    parser.add_argument('-i', dest='ams_file', required=True, nargs='+', help="AMS file(s) to process (one for Raman, one or two for ROA)")
-    parser.add_argument('-freqmin', type=float, required=True, help="Minimum frequency (nm)")
-    parser.add_argument('-freqmax', type=float, required=True, help="Maximum frequency (nm)")
-    parser.add_argument('-incoming_field_ev', type=float, required=True, help="Incoming field energy (eV)")
+    parser.add_argument('-w', choices=['raman', 'roa', 'verify', 'manifest'], required=True,
+                        help="Type of analysis: raman, roa, verify (check optimized paths against the reference "
+                             "implementation) or manifest (run every job listed in a TOML/JSON file)")
+    parser.add_argument('-i', dest='ams_file', required=True, nargs='+',
+                        help="AMS file(s) to process, plain or .gz/.xz/.zst (one for Raman, one or two for ROA), "
+                             "or the job manifest for -w manifest")
+    parser.add_argument('-freqmin', type=float, help="Minimum frequency (nm) (required unless -w manifest)")
+    parser.add_argument('-freqmax', type=float, help="Maximum frequency (nm) (required unless -w manifest)")
+    parser.add_argument('-incoming_field_ev', type=float, help="Incoming field energy (eV) (required unless -w manifest)")
     parser.add_argument('-pol', choices=['x', 'y', 'z', 'back'], help="Polarization for ROA (required for roa)")
     parser.add_argument('-norm', action='store_true', help="Apply normalization (optional)")
+    parser.add_argument('-enantiomer', action='store_true',
+                        help="ROA of an enantiomer pair from the first file; a second file is only checked as its mirror image (optional)")
+    parser.add_argument('-plot_format', choices=['png', 'pdf', 'svg'], default='png',
+                        help="Format of the saved plot (optional, default: png)")
+    parser.add_argument('-conv', choices=['auto', 'direct', 'fft', 'matrix'], default='auto',
+                        help="Broadening backend (optional, default: auto-selected from a calibrated cost model)")
+    parser.add_argument('-nthreads', type=int, default=0,
+                        help="Threads used for broadening (optional, default: 0 = all CPUs in the job's affinity mask)")
+    parser.add_argument('-precision', choices=['float64', 'float32'], default='float64',
+                        help="Broadening precision; float32 uses Kahan-compensated sums (optional, default: float64)")
+    parser.add_argument('-mem_budget', type=float, default=0.0,
+                        help="Memory budget in MB for intermediates and held spectra; spectra beyond it are "
+                             "spilled to memory-mapped .npy files (optional, default: 0 = no limit)")
+    parser.add_argument('-spill_dir', default="", help="Directory in which spilled spectra are kept during the run (optional, default: system temporary directory)")
+    parser.add_argument('-fit', dest='fit_file',
+                        help="Experimental spectrum to fit fwhm, frequency scale and intensity scale to (optional, raman/roa)")
+    parser.add_argument('-fit_starts', type=int, default=8, help="Number of starting points per file for -fit (optional, default: 8)")
+    parser.add_argument('-atol', type=float, default=0.0, help="Absolute tolerance for -w verify (optional, default: 0)")
+    parser.add_argument('-rtol', type=float, default=1.0e-10,
+                        help="Tolerance relative to the spectrum maximum for -w verify (optional, default: 1e-10)")
+    parser.add_argument('-nsynthetic', type=int, default=6,
+                        help="Number of randomized synthetic outputs checked by -w verify (optional, default: 6)")
 
 
     args = parser.parse_args(argv[1:])
 
+    # Frequency window and field energy are given per job in manifests
+    if args.w != 'manifest':
+        for option in ('freqmin', 'freqmax', 'incoming_field_ev'):
+            if getattr(args, option) is None:
+                parser.error(f"argument -{option} is required when -w {args.w} is selected.")
+
+    if args.enantiomer and (args.w != 'roa' or args.fit_file):
+        parser.error("argument -enantiomer can only be used with -w roa (without -fit).")
+    if args.enantiomer and len(args.ams_file) > 2:
+        parser.error("argument -enantiomer takes one AMS file, plus optionally its mirror image.")
+
+    if args.fit_file and args.w not in ('raman', 'roa'):
+        parser.error("argument -fit can only be used with -w raman or -w roa.")
+    if args.fit_file and args.norm:
+        parser.error("argument -norm cannot be used with -fit (the intensity scale is fitted).")
+    if args.fit_starts < 1:
+        parser.error("argument -fit_starts must be at least 1.")
+    if args.mem_budget < 0:
+        parser.error("argument -mem_budget must be at least 0.")
+
     # Enforce -pol required for ROA
     if args.w == 'roa' and args.pol is None:
         parser.error("argument -pol is required when -w roa is selected.")
 
     inp.raman = args.w == 'raman'
     inp.roa = args.w == 'roa'
+    inp.verify = args.w == 'verify'
+    inp.manifest = args.w == 'manifest'
     inp.ams_file = args.ams_file
     inp.norm = args.norm
+    inp.enantiomer = args.enantiomer
     inp.pol = args.pol if inp.roa else None
     inp.freq_min = args.freqmin
     inp.freq_max = args.freqmax
     inp.incoming_field_ev = args.incoming_field_ev
+    inp.plot_format = args.plot_format
+    inp.conv_backend = args.conv
+    inp.n_threads = args.nthreads
+    inp.precision = args.precision
+    inp.mem_budget = int(args.mem_budget * 1024**2)
+    inp.spill_dir = args.spill_dir
+    inp.fit_file = args.fit_file or ""
+    inp.fit_starts = args.fit_starts
+    inp.atol = args.atol
+    inp.rtol = args.rtol
+    inp.n_synthetic = args.nsynthetic
 
-    # For Raman, only one file is allowed; for ROA, one or two files
-    if inp.raman:
+    # For Raman (and manifests), only one file is allowed; for ROA, one or two files
+    if inp.raman or inp.manifest:
         inp.ams_file = args.ams_file[0]
         check_file_exists(inp.ams_file)
-    else:  # ROA
+        if inp.fit_file: check_file_exists(inp.fit_file)
+    else:  # ROA / verify
         inp.ams_file = args.ams_file
         for f in inp.ams_file:
             check_file_exists(f)
+        if inp.fit_file: check_file_exists(inp.fit_file)
 # -------------------------------------------------------------------------------------
 def check_file_exists(infile):
    """
@@ -61,4 +126,79 @@ def check_file_exists(infile):
    """
 
    if (not os.path.exists(infile)): output.error('file "' + infile + '" not found')
+
+   if detect_compression(infile) == 'zst':
+      try:
+         import zstandard
+      except ImportError:
+         output.error('file "' + infile + '" is zstd-compressed but the "zstandard" package is not installed')
+# -------------------------------------------------------------------------------------
+# Magic bytes of the compressed formats accepted for AMS outputs
+COMPRESSION_MAGIC = {
+    'gz':  b'\x1f\x8b',
+    'xz':  b'\xfd7zXZ\x00',
+    'zst': b'\x28\xb5\x2f\xfd',
+}
+# -------------------------------------------------------------------------------------
+def detect_compression(infile):
+    """
+    Detects the compression format of a file from its leading magic bytes.
+
+    Args:
+        infile (str): Path to the input file.
+
+    Returns:
+        str or None: 'gz', 'xz' or 'zst' for compressed files, None for plain text.
+    """
+
+    with open(infile, 'rb') as f:
+        head = f.read(6)
+
+    for fmt, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return fmt
+    return None
+# -------------------------------------------------------------------------------------
+def open_ams_file(infile):
+    """
+    Opens an AMS output as a text stream, transparently decompressing .gz/.xz/.zst files.
+
+    Decompression is lazy: only the part of the archive actually iterated over is
+    inflated, so readers that stop after the vibrational tables never decompress the rest.
+    No temporary files are written.
+
+    Args:
+        infile (str): Path to the (possibly compressed) AMS output.
+
+    Returns:
+        io.TextIOBase: Text stream to be used as a context manager.
+    """
+
+    fmt = detect_compression(infile)
+
+    if fmt == 'gz':
+        return gzip.open(infile, 'rt')
+    if fmt == 'xz':
+        return lzma.open(infile, 'rt')
+    if fmt == 'zst':
+        import zstandard
+        raw = open(infile, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    return open(infile, 'r')
+# -------------------------------------------------------------------------------------
+def strip_compression_suffix(infile):
+    """
+    Removes a trailing .gz/.xz/.zst extension so output names follow the uncompressed file.
+
+    Args:
+        infile (str): Path to the input file.
+
+    Returns:
+        str: Path without the compression extension.
+    """
+
+    for fmt in COMPRESSION_MAGIC:
+        if infile.endswith('.' + fmt):
+            return infile[:-len(fmt) - 1]
+    return infile
 # -------------------------------------------------------------------------------------
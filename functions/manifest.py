@@ -0,0 +1,287 @@
+import json
+import os
+import time
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+from classes import input_class, spectrum_store
+from functions import broadening, general, output, process
+
+# Keys accepted for each job (and in the [defaults] table); they mirror the command-line options
+JOB_KEYS = ('name', 'w', 'i', 'freqmin', 'freqmax', 'incoming_field_ev', 'pol', 'norm', 'plot', 'plot_format')
+# =====================================================================================
+def load_manifest(manifest_file):
+    """
+    Loads a TOML or JSON job manifest.
+
+    Example (TOML):
+        [defaults]
+        freqmin = 500
+        freqmax = 1700
+        incoming_field_ev = 3.41
+
+        [[job]]
+        w = "raman"
+        i = "vac_proline_init.out"
+
+        [[job]]
+        name = "back_2eV"
+        w = "roa"
+        i = ["vac_proline_init.out", "vac_proline_mirror.out"]
+        pol = "back"
+        incoming_field_ev = 2.0
+
+    Args:
+        manifest_file (str): Path to the .toml or .json manifest.
+
+    Returns:
+        list of dict: One dictionary per job, with the defaults applied and
+        AMS paths resolved relative to the manifest directory.
+    """
+    if manifest_file.endswith('.toml'):
+        if tomllib is None:
+            output.error('TOML manifests require Python >= 3.11, use a JSON manifest instead')
+        with open(manifest_file, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+
+    defaults = manifest.get('defaults', {})
+    entries = manifest.get('job', manifest.get('jobs', []))
+    if not entries:
+        output.error(f'no jobs found in manifest "{manifest_file}"')
+
+    root = os.path.dirname(os.path.abspath(manifest_file))
+    jobs = []
+    for entry in entries:
+        job = dict(defaults)
+        job.update(entry)
+        for key in job:
+            if key not in JOB_KEYS:
+                output.error(f'unknown key "{key}" in manifest "{manifest_file}"')
+        files = job.get('i', [])
+        files = [files] if isinstance(files, str) else list(files)
+        job['i'] = [f if os.path.isabs(f) else os.path.relpath(os.path.join(root, f)) for f in files]
+        jobs.append(job)
+    return jobs
+# -------------------------------------------------------------------------------------
+def build_job(job, k, inp):
+    """
+    Validates a manifest entry and turns it into an input_class object.
+
+    Args:
+        job (dict): Manifest entry with the defaults applied.
+        k (int): Job index (used in error messages).
+        inp (input_class): Command-line input (broadening options are inherited).
+
+    Returns:
+        input_class: Input parameters of the job, with extra 'name' and 'plot' attributes.
+    """
+    label = job.get('name', f'#{k + 1}')
+    for key in ('w', 'i', 'freqmin', 'freqmax', 'incoming_field_ev'):
+        if key not in job or job[key] == []:
+            output.error(f'job {label}: "{key}" is required')
+    if job['w'] not in ('raman', 'roa'):
+        output.error(f'job {label}: "w" must be "raman" or "roa"')
+    if job['w'] == 'raman' and len(job['i']) != 1:
+        output.error(f'job {label}: Raman jobs take exactly one AMS file')
+    if job['w'] == 'roa' and job.get('pol') not in process.ROA_COLUMNS:
+        output.error(f'job {label}: "pol" must be one of {", ".join(process.ROA_COLUMNS)} for ROA jobs')
+    if job.get('plot_format', 'png') not in ('png', 'pdf', 'svg'):
+        output.error(f'job {label}: "plot_format" must be png, pdf or svg')
+    for f in job['i']:
+        general.check_file_exists(f)
+
+    job_inp = input_class.input_class()
+    job_inp.raman = job['w'] == 'raman'
+    job_inp.roa = job['w'] == 'roa'
+    job_inp.ams_file = job['i'][0] if job_inp.raman else job['i']
+    job_inp.pol = job.get('pol') if job_inp.roa else None
+    job_inp.freq_min = float(job['freqmin'])
+    job_inp.freq_max = float(job['freqmax'])
+    job_inp.incoming_field_ev = float(job['incoming_field_ev'])
+    job_inp.norm = bool(job.get('norm', False))
+    job_inp.plot_format = job.get('plot_format', 'png')
+    job_inp.conv_backend = inp.conv_backend
+    job_inp.n_threads = inp.n_threads
+    job_inp.name = job.get('name')
+    job_inp.plot = bool(job.get('plot', True))
+    return job_inp
+# -------------------------------------------------------------------------------------
+def job_spectra(job):
+    """
+    Lists the (file, column) spectra a job needs.
+
+    Args:
+        job (input_class): Job input parameters.
+
+    Returns:
+        list of tuple: (ams_file, column) with column 'raman' or an ROA polarization.
+    """
+    if job.raman:
+        return [(job.ams_file, 'raman')]
+    return [(ams_file, job.pol) for ams_file in job.ams_file]
+# -------------------------------------------------------------------------------------
+def job_outputs(job):
+    """
+    Lists the CSV and plot files written by a job.
+
+    Args:
+        job (input_class): Job input parameters.
+
+    Returns:
+        tuple: (list of CSV paths, plot path or None).
+    """
+    if job.raman:
+        csvs = [process.raman_csv_name(job.ams_file, job.norm, job.name)]
+        plot = f'RAMAN_spectrum_NORM.{job.plot_format}' if job.norm else f'RAMAN_spectrum.{job.plot_format}'
+    else:
+        csvs = [process.roa_csv_name(f, job.pol, job.norm, job.name) for f in job.ams_file]
+        plot = f'ROA_spectrum_{job.pol}_NORM.{job.plot_format}' if job.norm else f'ROA_spectrum_{job.pol}.{job.plot_format}'
+    if job.name:
+        plot = f'{job.name}_{plot}'
+    return csvs, plot if job.plot else None
+# -------------------------------------------------------------------------------------
+def columns_of(tables, column):
+    """
+    Selects the stick spectrum of one column from the tables of an AMS output.
+
+    Args:
+        tables (dict): Output of process.read_ams_tables.
+        column (str): 'raman' or an ROA polarization.
+
+    Returns:
+        tuple: (freq_cm, intensities) lists.
+    """
+    if column == 'raman':
+        return tables['raman']
+    freq_cm, roa_int = tables['roa']
+    return freq_cm, roa_int[column]
+# =====================================================================================
+def run(inp):
+    """
+    Runs every job of a manifest with deduplicated work:
+      1. each AMS file is parsed exactly once (all tables in a single pass),
+      2. each (file, incoming field energy) pair is intensity-corrected in one vectorized
+         pass over all its columns (one pass per distinct set of modes),
+      3. each distinct spectrum is broadened once, batching all columns that share
+         the same file, energy and frequency window into one multi-spectrum call,
+    then writes and plots the results of every job.
+
+    Args:
+        inp (input_class): Command-line input; inp.ams_file is the manifest path.
+
+    Returns:
+        None
+    """
+    start = time.perf_counter()
+    jobs = [build_job(job, k, inp) for k, job in enumerate(load_manifest(inp.ams_file))]
+
+    # -- Refuse plans in which two jobs would overwrite each other's files
+    written = {}
+    for k, job in enumerate(jobs):
+        csvs, plot = job_outputs(job)
+        for path in csvs + ([plot] if plot else []):
+            if path in written:
+                output.error(f'jobs {written[path] + 1} and {k + 1} both write "{path}"; give them different "name" keys')
+            written[path] = k
+
+    # -- Dependency plan: which columns each (file, energy, window) needs
+    needed = {}
+    for job in jobs:
+        for ams_file, column in job_spectra(job):
+            key = (ams_file, job.incoming_field_ev, job.freq_min, job.freq_max)
+            needed.setdefault(key, set()).add(column)
+
+    # -- 1. Parse every file once
+    tables = {}
+    for ams_file, _, _, _ in needed:
+        if ams_file not in tables:
+            tables[ams_file] = process.read_ams_tables(ams_file)
+
+    # -- 2. Intensity correction of all columns used with each (file, energy) at once
+    columns_used = {}
+    for (ams_file, energy, _, _), columns in needed.items():
+        columns_used.setdefault((ams_file, energy), set()).update(columns)
+    corrected = {}
+    n_corrections = 0
+    for (ams_file, energy), columns in columns_used.items():
+        entry = corrected.setdefault((ams_file, energy), {})
+        groups = {}
+        for column in sorted(columns):
+            freq_cm, ints = columns_of(tables[ams_file], column)
+            groups.setdefault(tuple(freq_cm), []).append((column, ints))
+        for freq_cm, members in groups.items():
+            ints = np.array([member[1] for member in members], dtype=float).reshape(len(members), len(freq_cm)).T
+            ints = process.correct_intensity_columns(freq_cm, ints, energy)
+            n_corrections += 1
+            for m, (column, _) in enumerate(members):
+                entry[column] = (list(freq_cm), ints[:, m])
+
+    # -- 3. Broadening once per distinct spectrum, batching columns with identical modes
+    #       (batch size adapted to the memory budget; finished spectra beyond it are spilled to disk)
+    working, holding = process.memory_budgets(inp)
+    spectra = spectrum_store.spectrum_store(holding, inp.spill_dir)
+    grids = {}
+    n_broadenings = 0
+    for (ams_file, energy, freq_min, freq_max), columns in needed.items():
+        freqs = grids.setdefault((freq_min, freq_max), process.frequency_grid(freq_min, freq_max))
+        groups = {}
+        for column in sorted(columns):
+            freq_cm, ints = corrected[(ams_file, energy)][column]
+            groups.setdefault(tuple(freq_cm), []).append((column, ints))
+        for freq_cm, members in groups.items():
+            batch = broadening.spectra_per_batch(len(freqs), len(members), inp.precision, working)
+            for first in range(0, len(members), batch):
+                chunk = members[first:first + batch]
+                ints = np.array([member[1] for member in chunk], dtype=float).reshape(len(chunk), len(freq_cm)).T
+                specs = process.conv_stick(freqs, list(freq_cm), ints, backend=inp.conv_backend, n_threads=inp.n_threads,
+                                           dtype=inp.precision, mem_budget=working)
+                n_broadenings += 1
+                for m, (column, _) in enumerate(chunk):
+                    spectra.add((ams_file, energy, freq_min, freq_max, column), np.ascontiguousarray(specs[:, m]))
+
+    # -- Fan out: normalization, CSV files and plots of every job
+    for job in jobs:
+        csvs, plot = job_outputs(job)
+        freqs = grids[(job.freq_min, job.freq_max)]
+        results = [(freqs, spectra[(ams_file, job.incoming_field_ev, job.freq_min, job.freq_max, column)])
+                   for ams_file, column in job_spectra(job)]
+
+        # Raman: normalized on its own maximum; ROA: on the maximum across the job's files
+        if job.norm:
+            norm = np.max([np.max(np.abs(spec)) for _, spec in results])
+            if norm != 0:
+                results = [(freqs, spec / norm) for freqs, spec in results]
+
+        for output_csv, (freqs, spec) in zip(csvs, results):
+            process.save_spectrum(output_csv, freqs, spec)
+
+        if plot:
+            if job.raman:
+                process.plot_raman_spectrum(*results[0], normalize=job.norm, plot_format=job.plot_format,
+                                            output_filename=plot, show=False)
+            else:
+                process.plot_roa_spectrum(results, job.pol, normalize=job.norm, plot_format=job.plot_format,
+                                          output_filename=plot, show=False)
+
+    # -- Work saved through deduplication; "requested" is what running every spectrum
+    #    of every job on its own would take (one file read, correction and conv_stick call each)
+    requested = [spec for job in jobs for spec in job_spectra(job)]
+    print('')
+    print(f'   Manifest: {len(jobs)} jobs, {len(written)} files written in {time.perf_counter() - start:.2f} s')
+    print(f'   {"":<30} {"requested":>10} {"performed":>10}')
+    print(f'   {"Parsing (file reads)":<30} {len(requested):>10} {len(tables):>10}')
+    print(f'   {"Correction (passes)":<30} {len(requested):>10} {n_corrections:>10}')
+    print(f'   {"Broadening (conv_stick calls)":<30} {len(requested):>10} {n_broadenings:>10}')
+    print(f'   {len(spectra)} distinct spectra broadened for {len(requested)} requested')
+    if spectra.n_spilled:
+        print(f'   {spectra.n_spilled} spectra spilled to memory-mapped files (memory budget {inp.mem_budget / 1024**2:.3g} MB)')
+    print('')
+    spectra.close()
+# -------------------------------------------------------------------------------------
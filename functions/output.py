@@ -1,12 +1,13 @@
 import sys
 
 # -------------------------------------------------------------------------------------
-def error(error_message):
+def error(error_message, status=None):
    """
    Prints an error message and terminates execution.
 
    Args:
        error_message (str): The error message to be displayed.
+       status (int): Exit status (default: None, i.e. 0) reported to the calling shell.
 
    Returns:
        None: The function exits the program.
@@ -17,5 +18,5 @@ def error(error_message):
    print("   ERROR: " + error_message)
    print("")
    print("")
-   sys.exit()
+   sys.exit(status)
 # -------------------------------------------------------------------------------------
\ No newline at end of file
@@ -0,0 +1,51 @@
+import numpy as np
+
+# =====================================================================================
+def pixel_columns(fig, dpi):
+    """
+    Number of pixel columns spanned by a figure when saved at a given resolution.
+
+    Args:
+        fig (matplotlib.figure.Figure): Figure to be saved.
+        dpi (float): Output resolution (dots per inch).
+
+    Returns:
+        int: Figure width in pixels.
+    """
+    return max(1, int(round(fig.get_figwidth() * dpi)))
+# -------------------------------------------------------------------------------------
+def downsample_m4(x, y, n_columns):
+    """
+    Shape-preserving downsampling of a trace for display (M4 aggregation).
+
+    The x range is split into n_columns pixel columns and, for each column, only the
+    first, last, minimum and maximum points are kept. A line drawn through the kept
+    points rasterizes to the same pixels as the full trace, so peaks and sign changes
+    are never lost. Traces with at most 4 * n_columns points are returned unchanged.
+
+    Args:
+        x (numpy.ndarray): Ascending abscissae (e.g. frequency grid).
+        y (numpy.ndarray): Ordinates (e.g. spectrum intensities).
+        n_columns (int): Number of pixel columns available for the trace.
+
+    Returns:
+        tuple: Downsampled (x, y) arrays.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 4 * n_columns or x[-1] == x[0]:
+        return x, y
+
+    column = ((x - x[0]) / (x[-1] - x[0]) * n_columns).astype(int)
+    column = np.minimum(column, n_columns - 1)
+
+    # Sort by (column, y): the first/last entry of each column group are its min/max
+    order = np.lexsort((y, column))
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    ends = np.r_[starts[1:], len(x)] - 1
+    sorted_starts = np.flatnonzero(np.r_[True, column[order][1:] != column[order][:-1]])
+    sorted_ends = np.r_[sorted_starts[1:], len(x)] - 1
+
+    keep = np.unique(np.concatenate([starts, ends, order[sorted_starts], order[sorted_ends]]))
+    return x[keep], y[keep]
+# -------------------------------------------------------------------------------------
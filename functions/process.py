@@ -4,75 +4,311 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from classes import parameters
+from classes import parameters, spectrum_store
+from functions import broadening, general, plotting
 from matplotlib.ticker import ScalarFormatter
 
 param = parameters.parameters()
+
+# Column of the ROA table holding each polarization
+ROA_COLUMNS = {'y': 3, 'back': 4, 'x': 5, 'z': 6}
 # =====================================================================================
-def conv_stick(freqs, freq_peaks, int_peaks):
+def conv_stick(freqs, freq_peaks, int_peaks, backend='auto', n_threads=1, dtype='float64', mem_budget=0):
     """
     Convolves stick spectrum with a Lorentzian broadening.
 
     Args:
         freqs (numpy.ndarray): Array of frequency values for the spectrum.
         freq_peaks (list of float): Peak positions (frequencies) in cm^-1.
-        int_peaks (list of float): Intensities at each peak.
+        int_peaks (list of float): Intensities at each peak, or an (n_modes, n_spectra)
+            array to broaden several spectra sharing the same peaks at once.
+        backend (str): Broadening strategy ('direct', 'fft', 'matrix'),
+            or 'auto' to pick the fastest one from the calibrated cost model.
+        n_threads (int): Threads broadening contiguous chunks of the grid (0: all available CPUs).
+        dtype (str): 'float64', or 'float32' for Kahan-compensated single-precision sums.
+        mem_budget (int): Bytes available for broadening intermediates (0: no limit).
 
     Returns:
         numpy.ndarray: Broadened spectrum.
     """
-    spectrum = np.zeros(np.shape(freqs))
-    for peak in range(len(freq_peaks)):
-        spectrum += (param.fwhm / ((freqs - freq_peaks[peak])**2 + param.fwhm)) * int_peaks[peak]
-    return spectrum
+    return broadening.broaden(freqs, freq_peaks, int_peaks, param, backend=backend, n_threads=n_threads,
+                              dtype=dtype, mem_budget=mem_budget)
+# =====================================================================================
+def memory_budgets(inp):
+    """
+    Splits the global memory budget (-mem_budget) between broadening intermediates
+    and finished spectra held in memory.
+
+    Args:
+        inp (input_class): Input parameters.
+
+    Returns:
+        tuple: (working bytes, bytes for stored spectra); zeros mean no limit.
+    """
+    working = inp.mem_budget // 2
+    return working, inp.mem_budget - working
+# =====================================================================================
+def correct_intensities(freq_cm, intensities, incoming_field_ev):
+    """
+    Applies the excitation-energy intensity correction
+    I_corr = I * ( wavenumber_inc_efield - wavenumber_normalmode )^4 / wavenumber_normalmode
+
+    Args:
+        freq_cm (list of float): Vibrational frequencies in cm^-1.
+        intensities (list of float): Raman or ROA intensities.
+        incoming_field_ev (float): Incoming field energy in eV.
+
+    Returns:
+        list of float: Corrected intensities.
+    """
+    wavenumber_inc = incoming_field_ev * param.ev_to_wavenumbers
+    return [intensity * (wavenumber_inc - freq)**4 / freq for freq, intensity in zip(freq_cm, intensities)]
+# =====================================================================================
+def correct_intensity_columns(freq_cm, intensities, incoming_field_ev):
+    """
+    Vectorized correct_intensities for several intensity columns sharing the same
+    modes (same operation order, hence identical results).
+
+    Args:
+        freq_cm (list of float): Vibrational frequencies in cm^-1.
+        intensities (numpy.ndarray): (n_modes, n_columns) Raman and/or ROA intensities.
+        incoming_field_ev (float): Incoming field energy in eV.
+
+    Returns:
+        numpy.ndarray: (n_modes, n_columns) corrected intensities.
+    """
+    wavenumber_inc = incoming_field_ev * param.ev_to_wavenumbers
+    # The n_modes powers use Python's pow (numpy's may differ in the last bit)
+    factors = np.array([(wavenumber_inc - freq)**4 for freq in freq_cm], dtype=float)[:, None]
+    return intensities * factors / np.asarray(freq_cm, dtype=float)[:, None]
+# =====================================================================================
+def frequency_grid(freq_min, freq_max):
+    """
+    Builds the frequency grid on which spectra are broadened (about one point per cm^-1).
+
+    Args:
+        freq_min (float): Minimum frequency in cm^-1.
+        freq_max (float): Maximum frequency in cm^-1.
+
+    Returns:
+        numpy.ndarray: Array of frequency values for the spectrum.
+    """
+    n_points = int(freq_max - freq_min)
+    return np.linspace(freq_min, freq_max, n_points)
+# =====================================================================================
+def read_raman_data(inp):
+    """
+    Reads Raman data from the specified AMS file.
+
+    Args:
+        inp: Input parameters object. 
+
+    Returns:
+        tuple: Two lists:
+            - freq_cm (list of float): Vibrational frequencies in cm^-1.
+            - raman_int (list of float): Corresponding Raman intensities.
+    """
+    freq_cm = []
+    raman_int = []
+    raman_found = False
+    sticks_found = False
+    try:
+        with general.open_ams_file(inp.ams_file) as f:
+            for line in f:
+                if raman_found and sticks_found and len(line.strip()) == 0:
+                    break
+                if raman_found and sticks_found:
+                    parts = line.split()
+                    if len(parts) > 3:
+                        freq_cm.append(float(parts[2]))
+                        raman_int.append(float(parts[3]))
+                if line.startswith(param.raman_first_line):
+                    raman_found = True
+                if raman_found and line.startswith(' -'):
+                    sticks_found = True
+
+    except Exception as e:
+        print(f"Error reading Raman data: {e}")
+
+    return freq_cm, raman_int
+# =====================================================================================
+def read_ams_tables(ams_file):
+    """
+    Reads the Raman table and the ROA table (all polarizations) of an AMS output
+    in a single pass, stopping as soon as both have been read.
+
+    Args:
+        ams_file (str): Path to the (possibly compressed) AMS output.
+
+    Returns:
+        dict:
+            'raman': (freq_cm, raman_int) lists.
+            'roa': (freq_cm, {pol: roa_int}) with one list per polarization.
+            Tables missing from the file are returned empty.
+    """
+    raman_freq, raman_int = [], []
+    roa_freq, roa_int = [], {pol: [] for pol in ROA_COLUMNS}
+    table = None
+    sticks_found = False
+    done = set()
+    try:
+        with general.open_ams_file(ams_file) as f:
+            for line in f:
+                if table and sticks_found and len(line.strip()) == 0:
+                    done.add(table)
+                    table = None
+                    sticks_found = False
+                    if len(done) == 2:
+                        break
+                    continue
+                if table and sticks_found:
+                    parts = line.split()
+                    if table == 'raman' and len(parts) > 3:
+                        raman_freq.append(float(parts[2]))
+                        raman_int.append(float(parts[3]))
+                    elif table == 'roa' and len(parts) > 6:
+                        roa_freq.append(float(parts[2]))
+                        for pol, column in ROA_COLUMNS.items():
+                            roa_int[pol].append(float(parts[column]))
+                if line.startswith(param.raman_first_line) and 'raman' not in done:
+                    table = 'raman'
+                elif line.startswith(param.roa_first_line) and 'roa' not in done:
+                    table = 'roa'
+                if table and line.startswith(' -'):
+                    sticks_found = True
+
+    except Exception as e:
+        print(f"Error reading AMS data: {e}")
+
+    return {'raman': (raman_freq, raman_int), 'roa': (roa_freq, roa_int)}
+# =====================================================================================
+def raman_csv_name(ams_file, norm=False, label=None):
+    """
+    Name of the CSV file holding the Raman spectrum of an AMS output.
+
+    Args:
+        ams_file (str): Path to the (possibly compressed) AMS output.
+        norm (bool): Whether the spectrum is normalized.
+        label (str): Optional job label inserted before the suffix.
+
+    Returns:
+        str: Output CSV path.
+    """
+    base = general.strip_compression_suffix(ams_file)[:-4]
+    if label: base += f'_{label}'
+    return f'{base}_RAMAN_NORM.csv' if norm else f'{base}_RAMAN.csv'
+# =====================================================================================
+def roa_csv_name(ams_file, pol, norm=False, label=None):
+    """
+    Name of the CSV file holding the ROA spectrum of an AMS output.
+
+    Args:
+        ams_file (str): Path to the (possibly compressed) AMS output.
+        pol (str): Polarization label (e.g., 'x', 'y', 'z', 'back').
+        norm (bool): Whether the spectrum is normalized.
+        label (str): Optional job label inserted before the suffix.
+
+    Returns:
+        str: Output CSV path.
+    """
+    base = os.path.splitext(general.strip_compression_suffix(ams_file))[0]
+    if label: base += f'_{label}'
+    output_csv = f'{base}_ROA_{pol}'
+    if norm:
+        output_csv += '_NORM'
+    return output_csv + '.csv'
 # =====================================================================================
-def raman(inp):
+def save_spectrum(output_csv, freqs, spec):
+    """
+    Saves a spectrum to a two-column CSV file.
+
+    Args:
+        output_csv (str): Output file.
+        freqs (numpy.ndarray): Array of frequency values for the spectrum.
+        spec (numpy.ndarray): Array of spectrum intensities.
+
+    Returns:
+        None
+    """
+    with open(output_csv, 'w') as f:
+        for x, y in zip(freqs, spec):
+            f.write(f'{x:25.16f}   {y:25.16f}\n')
+# =====================================================================================
+def finish_plot(fig, show=True):
+    """
+    Shows a saved figure, or closes it when running unattended (e.g. many jobs).
+
+    Args:
+        fig (matplotlib.figure.Figure): Figure already saved to disk.
+        show (bool): If True, call plt.show().
+
+    Returns:
+        None
+    """
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+# =====================================================================================
+def plot_raman_spectrum(freqs, raman_spec, normalize=False, plot_format='png', output_filename=None, show=True):
+    """
+    Plot and save the Raman spectrum as a PNG (or PDF/SVG) file.
+    The trace is downsampled to the pixel columns of the saved figure.
+
+    Args:
+        freqs (numpy.ndarray): Array of frequency values for the spectrum.
+        raman_spec (numpy.ndarray): Array of processed Raman intensities.
+        normalize (bool): If True, use 'arb. units' for the y-label and save as *_NORM.png.
+        plot_format (str): Output format ('png', 'pdf' or 'svg').
+        output_filename (str): Plot file name (default: RAMAN_spectrum[_NORM].<plot_format>).
+        show (bool): If False, close the figure after saving instead of showing it.
+
+    Returns:
+        None
+    """
+
+    fig = plt.figure(figsize=(8, 6))
+    plt.rcParams['font.family'] = 'Times New Roman'
+
+    fontsize_label = 22
+    fontsize_ticks = 20
+
+    n_columns = plotting.pixel_columns(fig, param.plot_dpi)
+    plt.plot(*plotting.downsample_m4(freqs, raman_spec, n_columns), linestyle='-', color='blue')
+    plt.xlabel('Wavenumber (cm$^{-1}$)', fontsize=fontsize_label, fontname='Times New Roman', labelpad=10)
+    plt.ylabel('Raman Intensity (arb. units)' if normalize else 'Raman Intensity (a.u.)',
+               fontsize=fontsize_label, fontname='Times New Roman')
+    plt.xticks(fontsize=fontsize_ticks, fontname='Times New Roman')
+    plt.yticks(fontsize=fontsize_ticks, fontname='Times New Roman')
+    plt.grid(False)
+
+    # Add scientific notation offset (e.g., ×10¹⁵) to y-axis
+    ax = plt.gca()
+    formatter = ScalarFormatter(useMathText=True)
+    formatter.set_powerlimits((0, 0))  # Always use scientific notation
+    ax.yaxis.set_major_formatter(formatter)
+    ax.ticklabel_format(axis='y', style='sci', scilimits=(0,0))
+    ax.yaxis.offsetText.set_fontsize(fontsize_ticks)
+    ax.yaxis.offsetText.set_fontname('Times New Roman')
+
+    plt.tight_layout()
+    if output_filename is None:
+        output_filename = f'RAMAN_spectrum_NORM.{plot_format}' if normalize else f'RAMAN_spectrum.{plot_format}'
+    plt.savefig(output_filename, dpi=param.plot_dpi, bbox_inches='tight')
+    finish_plot(fig, show)
+# =====================================================================================
+def raman(inp, show=True):
     """
     Extraction of Raman data and processing.
     
     Args:
         inp (input_class): Input parameters for Raman data extraction.
+        show (bool): If False, close the plot after saving instead of showing it.
     
     Returns:
         None: This function does not return any value
     """
     # -------------------------------------------------------------------------------------
-    def read_raman_data(inp):
-        """
-        Reads Raman data from the specified AMS file.
-
-        Args:
-            inp: Input parameters object. 
-
-        Returns:
-            tuple: Two lists:
-                - freq_cm (list of float): Vibrational frequencies in cm^-1.
-                - raman_int (list of float): Corresponding Raman intensities.
-        """
-        freq_cm = []
-        raman_int = []
-        raman_found = False
-        sticks_found = False
-        try:
-            with open(inp.ams_file, 'r') as f:
-                for line in f:
-                    if raman_found and sticks_found and len(line.strip()) == 0:
-                        break
-                    if raman_found and sticks_found:
-                        parts = line.split()
-                        if len(parts) > 3:
-                            freq_cm.append(float(parts[2]))
-                            raman_int.append(float(parts[3]))
-                    if line.startswith(param.raman_first_line):
-                        raman_found = True
-                    if raman_found and line.startswith(' -'):
-                        sticks_found = True
-
-        except Exception as e:
-            print(f"Error reading Raman data: {e}")
-
-        return freq_cm, raman_int
-    # -------------------------------------------------------------------------------------
     def generate_and_save_raman_spectrum(inp, freq_cm, raman_int):
         """
         Generates the Raman spectrum by applying intensity correction and optional normalization,
@@ -90,14 +326,12 @@ def raman(inp):
                 raman_spec (numpy.ndarray): Array of processed Raman intensities.
         """
         # Apply intensity correction
-        # I_corr = I * ( wavenumber_inc_efield - wavenumber_normalmode )^4 / wavenumber_normalmode
-        for i in range(len(raman_int)):
-            raman_int[i] = raman_int[i] * (inp.incoming_field_ev * param.ev_to_wavenumbers - freq_cm[i])**4 / freq_cm[i]
+        raman_int = correct_intensities(freq_cm, raman_int, inp.incoming_field_ev)
     
         # Generate the Raman spectrum from a Lorentzian convolution
-        n_points = int(inp.freq_max - inp.freq_min)
-        freqs = np.linspace(inp.freq_min, inp.freq_max, n_points)
-        raman_spec = conv_stick(freqs, freq_cm, raman_int)
+        freqs = frequency_grid(inp.freq_min, inp.freq_max)
+        raman_spec = conv_stick(freqs, freq_cm, raman_int, backend=inp.conv_backend, n_threads=inp.n_threads,
+                                dtype=inp.precision, mem_budget=memory_budgets(inp)[0])
     
         # Normalize the Raman spectrum if requested
         if inp.norm:
@@ -107,117 +341,143 @@ def raman(inp):
                 raman_spec = raman_spec / norm
 
         # Save the Raman spectrum to a CSV file
-        output_csv = f'{inp.ams_file[:-4]}_RAMAN.csv'
-        if inp.norm: output_csv = f'{inp.ams_file[:-4]}_RAMAN_NORM.csv'
-        with open(output_csv, 'w') as f:
-            for x, y in zip(freqs, raman_spec):
-                f.write(f'{x:25.16f}   {y:25.16f}\n')    
+        save_spectrum(raman_csv_name(inp.ams_file, inp.norm), freqs, raman_spec)
 
         return freqs, raman_spec
     # -------------------------------------------------------------------------------------
-    def plot_raman_spectrum(freqs, raman_spec, normalize=False):
-        """
-        Plot and save the Raman spectrum as a PNG file.
-    
-        Args:
-            freqs (numpy.ndarray): Array of frequency values for the spectrum.
-            raman_spec (numpy.ndarray): Array of processed Raman intensities.
-            normalize (bool): If True, use 'arb. units' for the y-label and save as *_NORM.png.
-    
-        Returns:
-            None
-        """
-    
-        plt.figure(figsize=(8, 6))
-        plt.rcParams['font.family'] = 'Times New Roman'
-
-        fontsize_label = 22
-        fontsize_ticks = 20
-
-        plt.plot(freqs, raman_spec, linestyle='-', color='blue')
-        plt.xlabel('Wavenumber (cm$^{-1}$)', fontsize=fontsize_label, fontname='Times New Roman', labelpad=10)
-        plt.ylabel('Raman Intensity (arb. units)' if normalize else 'Raman Intensity (a.u.)',
-                   fontsize=fontsize_label, fontname='Times New Roman')
-        plt.xticks(fontsize=fontsize_ticks, fontname='Times New Roman')
-        plt.yticks(fontsize=fontsize_ticks, fontname='Times New Roman')
-        plt.grid(False)
-
-        # Add scientific notation offset (e.g., ×10¹⁵) to y-axis
-        ax = plt.gca()
-        formatter = ScalarFormatter(useMathText=True)
-        formatter.set_powerlimits((0, 0))  # Always use scientific notation
-        ax.yaxis.set_major_formatter(formatter)
-        ax.ticklabel_format(axis='y', style='sci', scilimits=(0,0))
-        ax.yaxis.offsetText.set_fontsize(fontsize_ticks)
-        ax.yaxis.offsetText.set_fontname('Times New Roman')
-
-        plt.tight_layout()
-        output_filename = 'RAMAN_spectrum_NORM.png' if normalize else 'RAMAN_spectrum.png'
-        plt.savefig(output_filename, dpi=300, bbox_inches='tight')
-        plt.show()
-    # -------------------------------------------------------------------------------------
     # Read vibrational frequencies and intensities from the AMS file,
     # then generate, process, plot, and save the Raman spectrum.
     freq_cm, raman_int = read_raman_data(inp)
     freqs, raman_spec = generate_and_save_raman_spectrum(inp, freq_cm, raman_int)
-    plot_raman_spectrum(freqs, raman_spec, normalize=inp.norm)
+    plot_raman_spectrum(freqs, raman_spec, normalize=inp.norm, plot_format=inp.plot_format, show=show)
 # =====================================================================================
-def roa(inp):
+def read_roa_data(inp):
+    """
+    Reads ROA data from the specified AMS file, extracting intensities based on polarization.
+
+    Args:
+        inp: Input parameters object. 
+
+    Returns:
+        tuple:
+            freq_cm (list of float): Vibrational frequencies in cm^-1.
+            roa_int (list of float): Corresponding ROA intensities for the selected polarization.
+    """
+    freq_cm = []
+    roa_int = []
+    try:
+        for ams_file in inp.ams_file:
+           roa_found = False
+           sticks_found = False
+           with general.open_ams_file(ams_file) as f:
+               for line in f:
+                   if roa_found and sticks_found and len(line.strip()) == 0:
+                       break
+                   if roa_found and sticks_found:
+                       parts = line.split()
+                       if len(parts) > 6:
+                           freq_cm.append(float(parts[2]))
+                           if inp.pol == 'x':
+                               roa_int.append(float(parts[5]))
+                           elif inp.pol == 'y':
+                               roa_int.append(float(parts[3]))
+                           elif inp.pol == 'back':
+                               roa_int.append(float(parts[4]))
+                           elif inp.pol == 'z':
+                               roa_int.append(float(parts[6]))
+                   if line.startswith(param.roa_first_line):
+                       roa_found = True
+                   if roa_found and line.startswith(' -'):
+                       sticks_found = True
+
+    except Exception as e:
+        print(f"Error reading ROA data: {e}")
+
+    return freq_cm, roa_int
+# =====================================================================================
+def plot_roa_spectrum(results, pol, normalize=False, plot_format='png', output_filename=None, show=True):
+    """
+    Plot and save the ROA spectrum(s) as a PNG (or PDF/SVG) file.
+    Each trace is downsampled to the pixel columns of the saved figure.
+
+    Args:
+        results (list): List of (freqs, roa_spec) tuples, one for each file.
+        pol (str): Polarization label (e.g., 'x', 'y', 'z', 'back').
+        normalize (bool): If True, use 'arb. units' for the y-label and save as *_NORM.png.
+        plot_format (str): Output format ('png', 'pdf' or 'svg').
+        output_filename (str): Plot file name (default: ROA_spectrum_<pol>[_NORM].<plot_format>).
+        show (bool): If False, close the figure after saving instead of showing it.
+
+    Returns:
+        None
+    """
+
+    fig = plt.figure(figsize=(8, 6))
+    plt.rcParams['font.family'] = 'Times New Roman'
+
+    fontsize_label = 22
+    fontsize_ticks = 20
+    n_columns = plotting.pixel_columns(fig, param.plot_dpi)
+
+    colors = ['blue', 'red']
+    labels = ['File 1', 'File 2']
+
+    # Ensure results is always a list
+    if isinstance(results, tuple):
+        results = [results]
+
+    plt.axhline(y=0, color='black', linestyle='--', linewidth=1, alpha=0.5)
+
+
+    for idx, (freqs, roa_spec) in enumerate(results):
+        color = colors[idx % len(colors)]
+        label = labels[idx] if len(results) > 1 else None
+        plt.plot(*plotting.downsample_m4(freqs, roa_spec, n_columns), linestyle='-', color=color, label=label)
+
+    # Set y-limits with margin
+    all_y = np.concatenate([np.abs(roa_spec) for _, roa_spec in results])
+    ymax = all_y.max()
+    margin = 1.10
+    plt.ylim(-ymax * margin, ymax * margin)
+
+    ax = plt.gca()
+    formatter = ScalarFormatter(useMathText=True)
+    formatter.set_powerlimits((0, 0))  # Always use scientific notation
+    ax.yaxis.set_major_formatter(formatter)
+    ax.ticklabel_format(axis='y', style='sci', scilimits=(0,0))
+
+    # Make the offset text (e.g., ×10¹⁵) larger and in Times New Roman
+    ax.yaxis.offsetText.set_fontsize(fontsize_ticks)
+    ax.yaxis.offsetText.set_fontname('Times New Roman')
+    #
+    plt.xlabel('Wavenumber (cm$^{-1}$)', fontsize=fontsize_label, fontname='Times New Roman',labelpad=10)
+    plt.ylabel('I$_R$ - I$_L$ (arb. units)' if normalize else 'I$_R$ - I$_L$ (a.u.)',
+       fontsize=fontsize_label, fontname='Times New Roman')
+    #plt.title(f'ROA Spectrum - {pol.upper()}', fontname='Times New Roman')
+    plt.xticks(fontsize=fontsize_ticks, fontname='Times New Roman')
+    plt.yticks(fontsize=fontsize_ticks, fontname='Times New Roman')
+    plt.grid(False)
+    #if len(results) > 1:
+    #    plt.legend()
+    plt.tight_layout()
+    if output_filename is None:
+        output_filename = f'ROA_spectrum_{pol}_NORM.{plot_format}' if normalize else f'ROA_spectrum_{pol}.{plot_format}'
+    plt.savefig(output_filename, dpi=param.plot_dpi, bbox_inches='tight')
+    finish_plot(fig, show)
+# =====================================================================================
+def roa(inp, show=True):
     """
     Extraction of ROA data and processing.
     
     Args:
         inp (input_class): Input parameters for Raman data extraction.
+        show (bool): If False, close the plot after saving instead of showing it.
     
     Returns:
         None: This function does not return any value
     """
     # -------------------------------------------------------------------------------------
-    def read_roa_data(inp):
-        """
-        Reads ROA data from the specified AMS file, extracting intensities based on polarization.
-    
-        Args:
-            inp: Input parameters object. 
-    
-        Returns:
-            tuple:
-                freq_cm (list of float): Vibrational frequencies in cm^-1.
-                roa_int (list of float): Corresponding ROA intensities for the selected polarization.
-        """
-        freq_cm = []
-        roa_int = []
-        try:
-            for ams_file in inp.ams_file:
-               roa_found = False
-               sticks_found = False
-               with open(ams_file, 'r') as f:
-                   for line in f:
-                       if roa_found and sticks_found and len(line.strip()) == 0:
-                           break
-                       if roa_found and sticks_found:
-                           parts = line.split()
-                           if len(parts) > 6:
-                               freq_cm.append(float(parts[2]))
-                               if inp.pol == 'x':
-                                   roa_int.append(float(parts[5]))
-                               elif inp.pol == 'y':
-                                   roa_int.append(float(parts[3]))
-                               elif inp.pol == 'back':
-                                   roa_int.append(float(parts[4]))
-                               elif inp.pol == 'z':
-                                   roa_int.append(float(parts[6]))
-                       if line.startswith(param.roa_first_line):
-                           roa_found = True
-                       if roa_found and line.startswith(' -'):
-                           sticks_found = True
-
-        except Exception as e:
-            print(f"Error reading ROA data: {e}")
-
-        return freq_cm, roa_int
-    # -------------------------------------------------------------------------------------
-    def generate_and_save_roa_spectrum(inp, freq_cm, roa_int):
+    def generate_and_save_roa_spectrum(inp, freq_cm, roa_int, store):
         """
         Generates the ROA spectrum by applying intensity correction and optional normalization,
         then saves the spectrum to a CSV file for each input AMS file.
@@ -227,6 +487,7 @@ def roa(inp):
                  'incoming_field_ev', 'ev_to_wavenumbers', 'ams_file', and 'pol' attributes.
             freq_cm (list of float): Vibrational frequencies in cm^-1 (concatenated from all files).
             roa_int (list of float): ROA intensities (concatenated from all files).
+            store (spectrum_store): Holds the spectra, spilling them to disk beyond the memory budget.
     
         Returns:
             list: List of (freqs, roa_spec) tuples, one for each file.
@@ -236,120 +497,187 @@ def roa(inp):
         results = []
     
         # First, generate all spectra (before normalization) to find the global max if needed
-        all_roa_specs = []
-        all_freqs = []
+        freqs = frequency_grid(inp.freq_min, inp.freq_max)
+        norm = 0.0
         for n in range(n_files):
             freq_cm_slice = freq_cm[n * roa_int_len : (n + 1) * roa_int_len]
             roa_int_slice = roa_int[n * roa_int_len : (n + 1) * roa_int_len]
     
             # Apply intensity correction
-            for i in range(len(roa_int_slice)):
-                roa_int_slice[i] = roa_int_slice[i] * (inp.incoming_field_ev * param.ev_to_wavenumbers - freq_cm_slice[i])**4 / freq_cm_slice[i]
+            roa_int_slice = correct_intensities(freq_cm_slice, roa_int_slice, inp.incoming_field_ev)
     
-            n_points = int(inp.freq_max - inp.freq_min)
-            freqs = np.linspace(inp.freq_min, inp.freq_max, n_points)
-            roa_spec = conv_stick(freqs, freq_cm_slice, roa_int_slice)
+            roa_spec = conv_stick(freqs, freq_cm_slice, roa_int_slice, backend=inp.conv_backend, n_threads=inp.n_threads,
+                                  dtype=inp.precision, mem_budget=memory_budgets(inp)[0])
     
-            all_roa_specs.append(roa_spec)
-            all_freqs.append(freqs)
-    
-        # Find the absolute maximum across all spectra for normalization
-        if inp.norm:
-            norm = np.max([np.max(np.abs(spec)) for spec in all_roa_specs])
-        else:
-            norm = 1.0
+            # Track the absolute maximum across all spectra for normalization
+            norm = max(norm, np.max(np.abs(roa_spec)))
+            store.add(n, roa_spec)
     
         for n in range(n_files):
-            roa_spec = all_roa_specs[n]
-            freqs = all_freqs[n]
+            roa_spec = store[n]
     
             # Normalize with respect to the global maximum if requested
             if inp.norm and norm != 0:
-                roa_spec = roa_spec / norm
+                roa_spec = store.add(n, roa_spec / norm)
     
             # Save the ROA spectrum to a CSV file
-            ams_file = inp.ams_file[n]
-            base = os.path.splitext(ams_file)[0]
-            output_csv = f'{base}_ROA_{inp.pol}'
-            if inp.norm:
-                output_csv += '_NORM'
-            output_csv += '.csv'
-            with open(output_csv, 'w') as f:
-                for x, y in zip(freqs, roa_spec):
-                    f.write(f'{x:25.16f}   {y:25.16f}\n')
+            save_spectrum(roa_csv_name(inp.ams_file[n], inp.pol, inp.norm), freqs, roa_spec)
     
             results.append((freqs, roa_spec))
     
         return results
     # -------------------------------------------------------------------------------------
-    def plot_roa_spectrum(results, pol, normalize=False):
-        """
-        Plot and save the ROA spectrum(s) as a PNG file.
-    
-        Args:
-            results (list): List of (freqs, roa_spec) tuples, one for each file.
-            pol (str): Polarization label (e.g., 'x', 'y', 'z', 'back').
-            normalize (bool): If True, use 'arb. units' for the y-label and save as *_NORM.png.
-    
-        Returns:
-            None
-        """
-    
-        plt.figure(figsize=(8, 6))
-        plt.rcParams['font.family'] = 'Times New Roman'
-
-        fontsize_label = 22
-        fontsize_ticks = 20
-        
-        colors = ['blue', 'red']
-        labels = ['File 1', 'File 2']
-    
-        # Ensure results is always a list
-        if isinstance(results, tuple):
-            results = [results]
-    
-        plt.axhline(y=0, color='black', linestyle='--', linewidth=1, alpha=0.5)
-
-
-        for idx, (freqs, roa_spec) in enumerate(results):
-            color = colors[idx % len(colors)]
-            label = labels[idx] if len(results) > 1 else None
-            plt.plot(freqs, roa_spec, linestyle='-', color=color, label=label)
-    
-        # Set y-limits with margin
-        all_y = np.concatenate([np.abs(roa_spec) for _, roa_spec in results])
-        ymax = all_y.max()
-        margin = 1.10
-        plt.ylim(-ymax * margin, ymax * margin)
-
-        ax = plt.gca()
-        formatter = ScalarFormatter(useMathText=True)
-        formatter.set_powerlimits((0, 0))  # Always use scientific notation
-        ax.yaxis.set_major_formatter(formatter)
-        ax.ticklabel_format(axis='y', style='sci', scilimits=(0,0))
-        
-        # Make the offset text (e.g., ×10¹⁵) larger and in Times New Roman
-        ax.yaxis.offsetText.set_fontsize(fontsize_ticks)
-        ax.yaxis.offsetText.set_fontname('Times New Roman')
-        #
-        plt.xlabel('Wavenumber (cm$^{-1}$)', fontsize=fontsize_label, fontname='Times New Roman',labelpad=10)
-        plt.ylabel('I$_R$ - I$_L$ (arb. units)' if normalize else 'I$_R$ - I$_L$ (a.u.)',
-           fontsize=fontsize_label, fontname='Times New Roman')
-        #plt.title(f'ROA Spectrum - {pol.upper()}', fontname='Times New Roman')
-        plt.xticks(fontsize=fontsize_ticks, fontname='Times New Roman')
-        plt.yticks(fontsize=fontsize_ticks, fontname='Times New Roman')
-        plt.grid(False)
-        #if len(results) > 1:
-        #    plt.legend()
-        plt.tight_layout()
-        output_filename = f'ROA_spectrum_{pol}_NORM.png' if normalize else f'ROA_spectrum_{pol}.png'
-        plt.savefig(output_filename, dpi=300, bbox_inches='tight')
-        plt.show()
-    # -------------------------------------------------------------------------------------
     # Read vibrational frequencies and intensities from the AMS file,
     # then generate, process, plot, and save the ROA spectrum.
+    store = spectrum_store.spectrum_store(memory_budgets(inp)[1], inp.spill_dir)
     freq_cm, roa_int = read_roa_data(inp)
-    results = generate_and_save_roa_spectrum(inp, freq_cm, roa_int)
-    plot_roa_spectrum(results, inp.pol, normalize=inp.norm)
+    results = generate_and_save_roa_spectrum(inp, freq_cm, roa_int, store)
+    plot_roa_spectrum(results, inp.pol, normalize=inp.norm, plot_format=inp.plot_format, show=show)
+    if store.n_spilled:
+        print(f'   {store.n_spilled} spectra spilled to memory-mapped files (memory budget {inp.mem_budget / 1024**2:.3g} MB)')
+    store.close()
 
    
+# =====================================================================================
+def read_roa_rows(ams_file, rows):
+    """
+    Reads selected rows of the ROA table, stopping right after the last one requested.
+    Only the requested rows are split and converted.
+
+    Args:
+        ams_file (str): Path to the (possibly compressed) AMS output.
+        rows (iterable of int): Zero-based mode indices to read.
+
+    Returns:
+        dict: Mode index -> (frequency, {pol: roa_int}) for the rows found in the file.
+    """
+    rows = set(rows)
+    last = max(rows) if rows else -1
+    found = {}
+    roa_found = False
+    sticks_found = False
+    index = 0
+    try:
+        with general.open_ams_file(ams_file) as f:
+            for line in f:
+                if roa_found and sticks_found:
+                    if len(line.strip()) == 0 or index > last:
+                        break
+                    if index in rows:
+                        parts = line.split()
+                        if len(parts) > 6:
+                            found[index] = (float(parts[2]), {pol: float(parts[column]) for pol, column in ROA_COLUMNS.items()})
+                    index += 1
+                if line.startswith(param.roa_first_line):
+                    roa_found = True
+                if roa_found and line.startswith(' -'):
+                    sticks_found = True
+
+    except Exception as e:
+        print(f"Error reading ROA data: {e}")
+
+    return found
+# =====================================================================================
+def check_mirror(tables, mirror_file, pol):
+    """
+    Quick sampled check that an AMS output is the mirror image of a parsed one:
+    same frequencies and ROA intensities of opposite sign for the selected polarization.
+    The strongest modes are always sampled, the rest are drawn at random.
+
+    Args:
+        tables (dict): Output of read_ams_tables for the original enantiomer.
+        mirror_file (str): Path to the mirror-image AMS output.
+        pol (str): Polarization of the requested spectrum.
+
+    Returns:
+        list of str: Description of every inconsistency found (empty if consistent).
+    """
+    freq_cm, roa_int = tables['roa']
+    n_modes = len(freq_cm)
+    n_samples = min(param.enantiomer_samples, n_modes)
+
+    strongest = np.argsort(np.abs(roa_int[pol]))[::-1][:(n_samples + 1) // 2]
+    others = np.setdiff1d(np.arange(n_modes), strongest)
+    rng = np.random.default_rng(n_modes)
+    sampled = np.concatenate([strongest, rng.choice(others, n_samples - len(strongest), replace=False)]).astype(int)
+
+    mirror_rows = read_roa_rows(mirror_file, sampled)
+    problems = []
+    for k in sorted(sampled):
+        if k not in mirror_rows:
+            problems.append(f'mode #{k + 1} missing')
+            continue
+        freq, values = mirror_rows[k]
+        if abs(freq - freq_cm[k]) > param.enantiomer_freq_tol:
+            problems.append(f'mode #{k + 1}: frequency {freq} vs {freq_cm[k]} cm^-1')
+        value, original = values[pol], roa_int[pol][k]
+        if abs(value + original) > param.enantiomer_rel_tol * max(abs(value), abs(original)):
+            problems.append(f'mode #{k + 1}, {pol}: {value} is not the mirror image of {original}')
+    return problems
+# =====================================================================================
+def enantiomers(inp, show=True):
+    """
+    ROA of an enantiomer pair from a single parse and broadening: the mirror-image
+    spectrum is the negative of the original one (same frequencies, opposite ROA).
+    If a mirror output is given as second file it is only checked on a sample of
+    modes; when the check fails it is processed in full instead.
+    The original, mirror, sum and difference spectra are saved to CSV files. A derived
+    mirror spectrum is saved under the original's name with a MIRROR label; only a
+    mirror output processed in full is saved under its own name.
+
+    Args:
+        inp (input_class): Input parameters; inp.ams_file holds the original
+            (and optionally the mirror) AMS output.
+        show (bool): If False, close the plot after saving instead of showing it.
+
+    Returns:
+        None: This function does not return any value
+    """
+    original_file = inp.ams_file[0]
+    mirror_file = inp.ams_file[1] if len(inp.ams_file) > 1 else None
+
+    # Parse and broaden the original enantiomer
+    tables = read_ams_tables(original_file)
+    freq_cm, roa_int = tables['roa'][0], tables['roa'][1][inp.pol]
+    roa_int = correct_intensities(freq_cm, roa_int, inp.incoming_field_ev)
+    freqs = frequency_grid(inp.freq_min, inp.freq_max)
+    roa_spec = conv_stick(freqs, freq_cm, roa_int, backend=inp.conv_backend, n_threads=inp.n_threads,
+                          dtype=inp.precision, mem_budget=memory_budgets(inp)[0])
+
+    # Mirror image: free, unless a supplied mirror output disagrees with it
+    mirror_spec = -roa_spec
+    mirror_parsed = False
+    if mirror_file is not None:
+        problems = check_mirror(tables, mirror_file, inp.pol)
+        if problems:
+            print(f'   WARNING: "{mirror_file}" is not the mirror image of "{original_file}":')
+            for problem in problems:
+                print(f'      {problem}')
+            print('   Processing it in full.')
+            mirror_tables = read_ams_tables(mirror_file)
+            mirror_freq, mirror_int = mirror_tables['roa'][0], mirror_tables['roa'][1][inp.pol]
+            mirror_int = correct_intensities(mirror_freq, mirror_int, inp.incoming_field_ev)
+            mirror_spec = conv_stick(freqs, mirror_freq, mirror_int, backend=inp.conv_backend, n_threads=inp.n_threads,
+                                     dtype=inp.precision, mem_budget=memory_budgets(inp)[0])
+            mirror_parsed = True
+        else:
+            print(f'   Mirror check: {min(param.enantiomer_samples, len(freq_cm))} sampled modes of "{mirror_file}" consistent')
+
+    # Normalize all spectra with respect to the maximum of the pair if requested
+    spectra = {'original': roa_spec, 'mirror': mirror_spec,
+               'sum': roa_spec + mirror_spec, 'diff': roa_spec - mirror_spec}
+    if inp.norm:
+        norm = max(np.max(np.abs(roa_spec)), np.max(np.abs(mirror_spec)))
+        if norm != 0:
+            spectra = {key: spec / norm for key, spec in spectra.items()}
+
+    save_spectrum(roa_csv_name(original_file, inp.pol, inp.norm), freqs, spectra['original'])
+    if mirror_parsed:
+        save_spectrum(roa_csv_name(mirror_file, inp.pol, inp.norm), freqs, spectra['mirror'])
+    else:
+        save_spectrum(roa_csv_name(original_file, inp.pol, inp.norm, label='MIRROR'), freqs, spectra['mirror'])
+    save_spectrum(roa_csv_name(original_file, inp.pol, inp.norm, label='ENANT_SUM'), freqs, spectra['sum'])
+    save_spectrum(roa_csv_name(original_file, inp.pol, inp.norm, label='ENANT_DIFF'), freqs, spectra['diff'])
+
+    plot_roa_spectrum([(freqs, spectra['original']), (freqs, spectra['mirror'])], inp.pol,
+                      normalize=inp.norm, plot_format=inp.plot_format, show=show)
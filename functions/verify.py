@@ -0,0 +1,414 @@
+import contextlib
+import copy
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from classes import input_class, parameters
+from functions import broadening, output, process
+
+param = parameters.parameters()
+
+# Threads used to check the chunked (multi-threaded) broadening path
+VERIFY_THREADS = 4
+
+# Column of the ROA table holding each polarization
+ROA_COLUMNS = {'y': 3, 'back': 4, 'x': 5, 'z': 6}
+
+# Scripts this package replaced; they are run unmodified, with the constants they hard-code
+LEGACY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'previous-script')
+LEGACY = {'fwhm': 20.0, 'freq_min': 500.0, 'freq_max': 1700.0, 'incoming_field_ev': 3.41}
+# =====================================================================================
+#   Reference implementation: frozen copy of the original parser and broadening of
+#   process.raman / process.roa (same algorithm as previous-script/extract_*.py, with
+#   the parameters of this package). Do not optimize.
+# =====================================================================================
+def reference_read(ams_file, pol=None):
+    """
+    Reads the Raman (pol=None) or ROA stick spectrum with the original line parser.
+
+    Args:
+        ams_file (str): Path to an uncompressed AMS output.
+        pol (str): ROA polarization ('x', 'y', 'z', 'back') or None for Raman.
+
+    Returns:
+        tuple: (freq_cm, intensities) lists.
+    """
+    first_line = param.raman_first_line if pol is None else param.roa_first_line
+    min_parts = 3 if pol is None else 6
+    column = 3 if pol is None else ROA_COLUMNS[pol]
+
+    freq_cm = []
+    intensities = []
+    table_found = False
+    sticks_found = False
+    with open(ams_file, 'r') as f:
+        for line in f:
+            if table_found and sticks_found and len(line.strip()) == 0:
+                break
+            if table_found and sticks_found:
+                parts = line.split()
+                if len(parts) > min_parts:
+                    freq_cm.append(float(parts[2]))
+                    intensities.append(float(parts[column]))
+            if line.startswith(first_line):
+                table_found = True
+            if table_found and line.startswith(' -'):
+                sticks_found = True
+    return freq_cm, intensities
+# -------------------------------------------------------------------------------------
+def reference_spectrum(freq_cm, intensities, inp):
+    """
+    Corrects and broadens a stick spectrum exactly as the original implementation.
+
+    Args:
+        freq_cm (list of float): Vibrational frequencies in cm^-1.
+        intensities (list of float): Raman or ROA intensities.
+        inp (input_class): Frequency window and incoming field energy.
+
+    Returns:
+        numpy.ndarray: Broadened (unnormalized) spectrum.
+    """
+    intensities = list(intensities)
+    for i in range(len(intensities)):
+        intensities[i] = intensities[i] * (inp.incoming_field_ev * param.ev_to_wavenumbers - freq_cm[i])**4 / freq_cm[i]
+
+    n_points = int(inp.freq_max - inp.freq_min)
+    freqs = np.linspace(inp.freq_min, inp.freq_max, n_points)
+
+    spectrum = np.zeros(np.shape(freqs))
+    for peak in range(len(freq_cm)):
+        spectrum += (param.fwhm / ((freqs - freq_cm[peak])**2 + param.fwhm)) * intensities[peak]
+    return spectrum
+# =====================================================================================
+def write_synthetic_output(path, n_modes, rng):
+    """
+    Writes a randomized AMS-like output with Raman and ROA tables.
+
+    Args:
+        path (str): Destination file.
+        n_modes (int): Number of vibrational modes.
+        rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+        None
+    """
+    freqs = np.sort(rng.uniform(20.0, 3600.0, n_modes))
+    raman = rng.exponential(100.0, n_modes)
+    depol = rng.uniform(0.0, 0.75, (n_modes, 2))
+    deltas = rng.standard_normal((n_modes, 4)) * rng.exponential(200.0, (n_modes, 1))
+
+    with open(path, 'w') as f:
+        f.write('\n' + param.raman_first_line + ' | Depol ratio (lin) | Depol ratio (nat)\n')
+        f.write(' ' + '-' * 85 + '\n')
+        for k in range(n_modes):
+            f.write(f' Mode #{k + 1}:{freqs[k]:15.6f}{raman[k]:19.6f}{depol[k, 0]:19.6f}{depol[k, 1]:19.6f}    A\n')
+        f.write('\n Delta in unit (A^4/amu) multiplied by 1000\n\n')
+        f.write(param.roa_first_line + '     |      Delta(180)   |      Delta_x(90)  |      Delta_z(90)\n')
+        f.write(' ' + '-' * 103 + '\n')
+        for k in range(n_modes):
+            f.write(f' Mode #{k + 1}:{freqs[k]:15.6f}' + ''.join(f'{d:20.4f}' for d in deltas[k]) + '    A\n')
+        f.write('\n')
+# -------------------------------------------------------------------------------------
+def compress_copy(path, fmt):
+    """
+    Writes a .gz or .xz copy of a file next to it.
+
+    Args:
+        path (str): File to compress.
+        fmt (str): 'gz' or 'xz'.
+
+    Returns:
+        str: Path of the compressed copy.
+    """
+    opener = gzip.open if fmt == 'gz' else lzma.open
+    compressed = f'{path}.{fmt}'
+    with open(path, 'rb') as src, opener(compressed, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return compressed
+# -------------------------------------------------------------------------------------
+def run_legacy_script(ams_file, pol, workdir):
+    """
+    Runs previous-script/extract_raman.py (pol=None) or extract_roa.py -corr on a copy
+    of an AMS output in an empty directory and loads the spectrum it writes.
+
+    Args:
+        ams_file (str): Path to an uncompressed AMS output.
+        pol (str): ROA polarization or None for Raman.
+        workdir (str): Directory to create and run the script in.
+
+    Returns:
+        numpy.ndarray or None: Spectrum column of the CSV file, None if none was written.
+    """
+    os.makedirs(workdir)
+    local = os.path.basename(ams_file)
+    shutil.copy(ams_file, os.path.join(workdir, local))
+    if pol is None:
+        command = [sys.executable, os.path.join(LEGACY_DIR, 'extract_raman.py'), '-f', local]
+    else:
+        command = [sys.executable, os.path.join(LEGACY_DIR, 'extract_roa.py'), '-pol', pol, '-f', local, '-corr']
+    subprocess.run(command, cwd=workdir, env=dict(os.environ, MPLBACKEND='Agg'),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # The scripts build odd names (e.g. *_ROA_x.csv_corrected.csv): take the only CSV written
+    csvs = [f for f in os.listdir(workdir) if f.endswith('.csv')]
+    if len(csvs) != 1:
+        return None
+    return np.loadtxt(os.path.join(workdir, csvs[0]), ndmin=2)[:, 1]
+# -------------------------------------------------------------------------------------
+def run_end_to_end(ams_file, pol, inp, workdir):
+    """
+    Runs process.raman (pol=None) or process.roa with normalization on a copy of an
+    AMS output inside workdir (plots go to the working directory) and loads its CSV.
+
+    Args:
+        ams_file (str): Path to the (possibly compressed) AMS output.
+        pol (str): ROA polarization or None for Raman.
+        inp (input_class): Frequency window, incoming field energy and broadening options.
+        workdir (str): Directory to create and run in.
+
+    Returns:
+        numpy.ndarray or None: Spectrum column of the CSV file, None if the run exited.
+    """
+    os.makedirs(workdir)
+    local = os.path.join(workdir, os.path.basename(ams_file))
+    shutil.copy(ams_file, local)
+
+    case = input_class.input_class()
+    case.raman = pol is None
+    case.roa = pol is not None
+    case.ams_file = local if case.raman else [local]
+    case.pol = pol
+    case.norm = True
+    case.freq_min, case.freq_max = inp.freq_min, inp.freq_max
+    case.incoming_field_ev = inp.incoming_field_ev
+    case.conv_backend = inp.conv_backend
+    case.n_threads = inp.n_threads
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if case.raman:
+                process.raman(case, show=False)
+            else:
+                process.roa(case, show=False)
+    except SystemExit:
+        return None
+    finally:
+        os.chdir(cwd)
+
+    output_csv = process.raman_csv_name(local, True) if case.raman else process.roa_csv_name(local, pol, True)
+    return np.loadtxt(output_csv, ndmin=2)[:, 1]
+# -------------------------------------------------------------------------------------
+def batched_spectra(freq_cm, intensities, inp, backend, batch):
+    """
+    Corrects and broadens several intensity columns sharing the same modes as -w manifest
+    does: one vectorized correction, then multi-spectrum conv_stick calls of batch columns.
+
+    Args:
+        freq_cm (list of float): Vibrational frequencies in cm^-1.
+        intensities (numpy.ndarray): (n_modes, n_columns) intensities.
+        inp (input_class): Frequency window and incoming field energy.
+        backend (str): Broadening backend.
+        batch (int): Number of columns broadened per call.
+
+    Returns:
+        numpy.ndarray: (n_points, n_columns) broadened spectra.
+    """
+    corrected = process.correct_intensity_columns(freq_cm, intensities, inp.incoming_field_ev)
+    freqs = process.frequency_grid(inp.freq_min, inp.freq_max)
+    spectra = np.empty((len(freqs), corrected.shape[1]))
+    for first in range(0, corrected.shape[1], batch):
+        spectra[:, first:first + batch] = process.conv_stick(freqs, freq_cm, corrected[:, first:first + batch],
+                                                             backend=backend)
+    return spectra
+# -------------------------------------------------------------------------------------
+def deviation(reference, candidate):
+    """
+    Maximum absolute deviation and maximum deviation relative to the largest
+    reference value (pointwise ratios are meaningless at ROA sign changes).
+
+    Args:
+        reference (numpy.ndarray): Reference values.
+        candidate (numpy.ndarray): Values to validate.
+
+    Returns:
+        tuple: (max_abs, max_rel) as floats.
+    """
+    reference = np.asarray(reference, dtype=float)
+    candidate = np.asarray(candidate, dtype=float)
+    if reference.shape != candidate.shape:
+        return float('inf'), float('inf')
+    if reference.size == 0:
+        return 0.0, 0.0
+
+    max_abs = float(np.max(np.abs(reference - candidate)))
+    scale = float(np.max(np.abs(reference)))
+    if scale == 0.0:
+        return max_abs, 0.0 if max_abs == 0.0 else float('inf')
+    return max_abs, max_abs / scale
+# =====================================================================================
+def run(inp, pipelines=True):
+    """
+    Runs the reference and optimized parsers/broadening backends side by side on the
+    given AMS outputs plus randomized synthetic ones, and reports the deviations.
+    Each output is also run end to end (process.raman / process.roa, normalized CSV)
+    and through the unmodified previous-script/extract_*.py, whose hard-coded window,
+    energy and line width (LEGACY) the optimized path then uses for the comparison.
+
+    Args:
+        inp (input_class): Input parameters (files, frequency window, tolerances).
+        pipelines (bool): Also run the end-to-end and previous-script checks (slow: they plot).
+
+    Returns:
+        None: Exits with status 1 if any spectrum deviates beyond atol + rtol * max|reference|.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(inp.verify_seed)
+    failures = 0
+
+    # Force several chunks even on the small grids used here
+    chunk_param = copy.copy(param)
+    chunk_param.conv_min_chunk_points = 1
+
+    # Same optimized path with the constants of the previous scripts
+    legacy_param = copy.copy(param)
+    legacy_param.fwhm = LEGACY['fwhm']
+    legacy_freqs = process.frequency_grid(LEGACY['freq_min'], LEGACY['freq_max'])
+    run_legacy = pipelines and os.path.isdir(LEGACY_DIR)
+
+    print('')
+    print(f'   {"Spectrum":<44} {"Backend":<10} {"Max. abs.":>12} {"Max. rel.":>12}')
+    print('   ' + '-' * 80)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # (reference file, file read by the optimized path)
+        cases = [(ams_file, ams_file) for ams_file in inp.ams_file]
+        for n in range(inp.n_synthetic):
+            plain = os.path.join(tmpdir, f'synthetic_{n}.out')
+            write_synthetic_output(plain, int(rng.integers(1, 150)), rng)
+            fmt = (None, 'gz', 'xz')[n % 3]
+            cases.append((plain, compress_copy(plain, fmt) if fmt else plain))
+
+        # Whole pipelines (slow: they plot): one spectrum per output, cycling through Raman and every ROA polarization
+        kinds = (None,) + tuple(ROA_COLUMNS)
+        pipeline_pols = [(kinds[n % len(kinds)],) if pipelines else () for n in range(len(cases))]
+
+        # The previous scripts run in separate interpreters, in parallel with the checks below
+        legacy_pool = ThreadPoolExecutor(max_workers=VERIFY_THREADS)
+        legacy_runs = {}
+        if run_legacy:
+            for n, (ref_file, _) in enumerate(cases):
+                for pol in pipeline_pols[n]:
+                    workdir = os.path.join(tmpdir, f'legacy_{n}_{pol or "raman"}')
+                    legacy_runs[(n, pol)] = legacy_pool.submit(run_legacy_script, ref_file, pol, workdir)
+
+        for n, (ref_file, opt_file) in enumerate(cases):
+            references = {}
+            for pol in (None,) + tuple(ROA_COLUMNS):
+                label = f'{os.path.basename(opt_file)} {"RAMAN" if pol is None else "ROA_" + pol}'
+
+                # Parser
+                ref_freq, ref_int = reference_read(ref_file, pol)
+                case = input_class.input_class()
+                if pol is None:
+                    case.ams_file = opt_file
+                    opt_freq, opt_int = process.read_raman_data(case)
+                else:
+                    case.ams_file = [opt_file]
+                    case.pol = pol
+                    opt_freq, opt_int = process.read_roa_data(case)
+                tables = process.read_ams_tables(opt_file)
+                one_pass_freq, one_pass_int = tables['raman'] if pol is None else (tables['roa'][0], tables['roa'][1][pol])
+                sticks_ok = (list(ref_freq) == list(opt_freq) == list(one_pass_freq) and
+                             list(ref_int) == list(opt_int) == list(one_pass_int))
+                failures += not sticks_ok
+                print(f'   {label:<44} {"parser":<10} {"":>12} {"":>12}  {"ok" if sticks_ok else "FAIL"}')
+                if not sticks_ok:
+                    continue
+
+                # Correction + broadening
+                reference = reference_spectrum(ref_freq, ref_int, inp)
+                freqs = process.frequency_grid(inp.freq_min, inp.freq_max)
+                corrected = process.correct_intensities(opt_freq, opt_int, inp.incoming_field_ev)
+                scale = float(np.max(np.abs(reference))) if reference.size else 0.0
+                references[pol] = reference
+                for backend in broadening.EXACT_BACKENDS:
+                    candidates = [(backend, process.conv_stick(freqs, opt_freq, corrected, backend=backend))]
+                    if backend in broadening.CHUNKABLE_BACKENDS:
+                        candidates.append((f'{backend}/{VERIFY_THREADS}t',
+                                           broadening.broaden(freqs, opt_freq, corrected, chunk_param, backend=backend,
+                                                              n_threads=VERIFY_THREADS, log=False)))
+                    if backend in broadening.COMPENSATED_BACKENDS:
+                        candidates.append((f'{backend}/f32',
+                                           process.conv_stick(freqs, opt_freq, corrected, backend=backend, dtype='float32')))
+                    for name, candidate in candidates:
+                        max_abs, max_rel = deviation(reference, candidate)
+                        rtol = max(inp.rtol, param.float32_rtol) if name.endswith('/f32') else inp.rtol
+                        ok = max_abs <= inp.atol + rtol * scale
+                        failures += not ok
+                        print(f'   {label:<44} {name:<10} {max_abs:12.3e} {max_rel:12.3e}  {"ok" if ok else "FAIL"}')
+
+                if pol not in pipeline_pols[n]:
+                    continue
+
+                # process.raman / process.roa end to end (normalization and CSV output included)
+                norm = scale if scale != 0.0 else 1.0
+                workdir = os.path.join(tmpdir, f'pipeline_{n}_{pol or "raman"}')
+                candidates = [('end-to-end', reference / norm, run_end_to_end(opt_file, pol, inp, workdir))]
+
+                # previous-script/extract_*.py against the optimized path with the same constants
+                if run_legacy:
+                    legacy_corrected = process.correct_intensities(opt_freq, opt_int, LEGACY['incoming_field_ev'])
+                    optimized = broadening.broaden(legacy_freqs, opt_freq, legacy_corrected, legacy_param,
+                                                   backend=inp.conv_backend, n_threads=inp.n_threads, log=False)
+                    candidates.append(('legacy', legacy_runs[(n, pol)].result(), optimized))
+
+                for name, reference_values, candidate in candidates:
+                    if candidate is None:
+                        max_abs, max_rel, ok = float('inf'), float('inf'), False
+                    else:
+                        max_abs, max_rel = deviation(reference_values, candidate)
+                        ok = max_abs <= inp.atol + inp.rtol * float(np.max(np.abs(reference_values), initial=0.0))
+                    failures += not ok
+                    print(f'   {label:<44} {name:<10} {max_abs:12.3e} {max_rel:12.3e}  {"ok" if ok else "FAIL"}')
+
+            # All ROA columns at once (as -w manifest): vectorized correction and multi-spectrum
+            # broadening, in batches of two spectra as sized by spectra_per_batch for a small budget
+            if all(pol in references for pol in ROA_COLUMNS):
+                label = f'{os.path.basename(opt_file)} ROA (all, batched)'
+                freq_cm, roa_int = process.read_ams_tables(opt_file)['roa']
+                intensities = np.array([roa_int[pol] for pol in ROA_COLUMNS], dtype=float).reshape(len(ROA_COLUMNS), -1).T
+                n_points = len(references['y'])
+                batch = broadening.spectra_per_batch(n_points, len(ROA_COLUMNS), mem_budget=2 * 3 * n_points * 8)
+                for backend in broadening.EXACT_BACKENDS:
+                    spectra = batched_spectra(freq_cm, intensities, inp, backend, batch)
+                    max_abs, max_rel, ok = 0.0, 0.0, True
+                    for m, pol in enumerate(ROA_COLUMNS):
+                        col_abs, col_rel = deviation(references[pol], spectra[:, m])
+                        max_abs, max_rel = max(max_abs, col_abs), max(max_rel, col_rel)
+                        ok = ok and col_abs <= inp.atol + inp.rtol * float(np.max(np.abs(references[pol]), initial=0.0))
+                    failures += not ok
+                    name = f'{backend}/b{batch}'
+                    print(f'   {label:<44} {name:<10} {max_abs:12.3e} {max_rel:12.3e}  {"ok" if ok else "FAIL"}')
+
+        legacy_pool.shutdown()
+
+    print('')
+    print(f'   Verified {len(cases)} outputs in {time.perf_counter() - start:.2f} s '
+          f'(atol = {inp.atol:.1e}, rtol = {inp.rtol:.1e}, float32 rtol = {max(inp.rtol, param.float32_rtol):.1e})')
+    print('')
+
+    if failures:
+        output.error(f'{failures} check(s) deviate from the reference implementation', status=1)
+# -------------------------------------------------------------------------------------
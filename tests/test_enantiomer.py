@@ -0,0 +1,89 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes import input_class, parameters
+from functions import process, verify
+
+param = parameters.parameters()
+
+
+# -------------------------------------------------------------------------------------
+def mirror_copy(source, destination, pol=None, factor=1.0):
+    """
+    Writes the mirror image of a synthetic output (ROA intensities with opposite sign).
+    The largest |ROA| of column pol, if given, is additionally multiplied by factor.
+    """
+    tables = process.read_ams_tables(source)
+    perturbed = int(np.argmax(np.abs(tables['roa'][1][pol]))) if pol else -1
+
+    roa_found = sticks_found = False
+    index = 0
+    with open(source) as src, open(destination, 'w') as dst:
+        for line in src:
+            if roa_found and sticks_found and line.strip():
+                parts = line.split()
+                deltas = [-float(d) for d in parts[3:7]]
+                if index == perturbed:
+                    column = process.ROA_COLUMNS[pol] - 3
+                    deltas[column] *= factor
+                line = f' Mode #{index + 1}:{float(parts[2]):15.6f}' + ''.join(f'{d:20.4f}' for d in deltas) + '    A\n'
+                index += 1
+            elif roa_found and sticks_found:
+                roa_found = False
+            if line.startswith(param.roa_first_line):
+                roa_found = True
+            if roa_found and line.startswith(' -'):
+                sticks_found = True
+            dst.write(line)
+# -------------------------------------------------------------------------------------
+@pytest.fixture
+def original(tmp_path):
+    path = str(tmp_path / 'original.out')
+    verify.write_synthetic_output(path, 40, np.random.default_rng(3))
+    return path
+# -------------------------------------------------------------------------------------
+def test_read_roa_rows_matches_full_parse(original):
+    freq_cm, roa_int = process.read_ams_tables(original)['roa']
+    rows = process.read_roa_rows(original, [0, 7, 39, 40])
+    assert sorted(rows) == [0, 7, 39]
+    for k, (freq, values) in rows.items():
+        assert freq == freq_cm[k]
+        assert values == {pol: roa_int[pol][k] for pol in process.ROA_COLUMNS}
+# -------------------------------------------------------------------------------------
+def test_check_mirror_accepts_flipped_signs(original, tmp_path):
+    mirror = str(tmp_path / 'mirror.out')
+    mirror_copy(original, mirror)
+    tables = process.read_ams_tables(original)
+    for pol in process.ROA_COLUMNS:
+        assert process.check_mirror(tables, mirror, pol) == []
+# -------------------------------------------------------------------------------------
+def test_check_mirror_rejects_perturbed_mode(original, tmp_path):
+    mirror = str(tmp_path / 'mirror.out')
+    mirror_copy(original, mirror, pol='back', factor=1.2)
+    problems = process.check_mirror(process.read_ams_tables(original), mirror, 'back')
+    assert len(problems) == 1 and 'back' in problems[0]
+# -------------------------------------------------------------------------------------
+@pytest.mark.parametrize('factor', [1.0, 1.2])
+def test_derived_mirror_does_not_overwrite_mirror_csv(original, tmp_path, monkeypatch, factor):
+    mirror = str(tmp_path / 'mirror.out')
+    mirror_copy(original, mirror, pol='back', factor=factor)
+    monkeypatch.chdir(tmp_path)
+
+    inp = input_class.input_class()
+    inp.roa = inp.enantiomer = True
+    inp.ams_file = [original, mirror]
+    inp.pol = 'back'
+    inp.freq_min, inp.freq_max, inp.incoming_field_ev = 0.0, 4000.0, 3.41
+    inp.conv_backend = 'direct'
+    process.enantiomers(inp, show=False)
+
+    parsed = factor != 1.0   # A failed check processes the mirror output in full
+    assert os.path.exists(process.roa_csv_name(mirror, 'back')) == parsed
+    assert os.path.exists(process.roa_csv_name(original, 'back', label='MIRROR')) != parsed
+# -------------------------------------------------------------------------------------
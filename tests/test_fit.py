@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes import input_class
+from functions import fit, general, process
+
+TRUE_PARAMETERS = np.array([60.0, 0.97, 2.5e-14])   # fwhm, frequency scale, amplitude
+
+
+# -------------------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def sticks():
+    freq_cm, ints = process.read_ams_tables(os.path.join(ROOT, 'data', 'vac_proline_init.out'))['raman']
+    return np.array(freq_cm), np.array(process.correct_intensities(freq_cm, ints, 3.41))
+# -------------------------------------------------------------------------------------
+def test_jacobian_matches_finite_differences(sticks):
+    x = np.linspace(500.0, 1700.0, 600)
+    p = np.array([90.0, 1.02, 3.0e-14])
+    _, jac = fit.model(x, *sticks, p, jacobian=True)
+    for k in range(len(p)):
+        step = np.zeros(3)
+        step[k] = 1.0e-6 * p[k]
+        numerical = (fit.model(x, *sticks, p + step) - fit.model(x, *sticks, p - step)) / (2.0 * step[k])
+        np.testing.assert_allclose(jac[:, k], numerical, rtol=1.0e-6, atol=1.0e-6 * np.max(np.abs(numerical)))
+# -------------------------------------------------------------------------------------
+def test_fit_recovers_known_parameters(sticks):
+    x = np.linspace(500.0, 1700.0, 1200)
+    clean = fit.model(x, *sticks, TRUE_PARAMETERS)
+    y = clean + np.random.default_rng(0).normal(0.0, 1.0e-3 * np.max(clean), len(x))
+
+    fits = [fit.fit_spectrum(x, y, *sticks, w0, scale0) for w0, scale0 in fit.start_points(8)]
+    best = min(fits, key=lambda result: result['cost'])
+    np.testing.assert_allclose(best['p'], TRUE_PARAMETERS, rtol=1.0e-3)
+# -------------------------------------------------------------------------------------
+def test_fit_rejects_norm(tmp_path):
+    argv = ['raman_roa', '-w', 'raman', '-i', os.path.join(ROOT, 'data', 'vac_proline_init.out'),
+            '-freqmin', '500', '-freqmax', '1700', '-incoming_field_ev', '3.41',
+            '-fit', str(tmp_path / 'experiment.csv'), '-norm']
+    with pytest.raises(SystemExit) as exit_info:
+        general.read_command_line(argv, input_class.input_class())
+    assert exit_info.value.code == 2
+# -------------------------------------------------------------------------------------
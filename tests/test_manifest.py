@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes import input_class
+from functions import manifest, process
+
+AMS_FILES = ('vac_proline_init.out', 'vac_proline_mirror.out')
+
+# (w, files, pol, norm, incoming_field_ev, name)
+JOBS = [
+    ('raman', ['vac_proline_init.out'], None, False, 3.41, None),
+    ('roa', list(AMS_FILES), 'back', True, 3.41, None),
+    ('roa', list(AMS_FILES), 'x', False, 3.41, None),
+    ('roa', ['vac_proline_init.out'], 'x', False, 2.0, 'lowE'),
+]
+
+
+# -------------------------------------------------------------------------------------
+def copy_outputs(directory):
+    os.makedirs(directory)
+    for ams_file in AMS_FILES:
+        shutil.copy(os.path.join(ROOT, 'data', ams_file), directory)
+    return directory
+# -------------------------------------------------------------------------------------
+def single_job_csvs(directory, monkeypatch):
+    """
+    Runs every job on its own with process.raman / process.roa and returns its CSV files.
+    """
+    monkeypatch.chdir(copy_outputs(directory))
+    csvs = {}
+    for w, files, pol, norm, energy, name in JOBS:
+        inp = input_class.input_class()
+        inp.raman, inp.roa = w == 'raman', w == 'roa'
+        inp.ams_file = files[0] if inp.raman else list(files)
+        inp.pol, inp.norm, inp.incoming_field_ev = pol, norm, energy
+        inp.freq_min, inp.freq_max = 0.0, 2000.0
+        inp.conv_backend = 'direct'
+        if inp.raman:
+            process.raman(inp, show=False)
+            outputs = [(process.raman_csv_name(files[0], norm, name), process.raman_csv_name(files[0], norm))]
+        else:
+            process.roa(inp, show=False)
+            outputs = [(process.roa_csv_name(f, pol, norm, name), process.roa_csv_name(f, pol, norm)) for f in files]
+        for manifest_csv, single_csv in outputs:
+            with open(single_csv) as f:
+                csvs[manifest_csv] = f.read()
+    return csvs
+# -------------------------------------------------------------------------------------
+@pytest.mark.parametrize('mem_budget', [0, 40000])
+def test_manifest_matches_single_jobs(tmp_path, monkeypatch, capsys, mem_budget):
+    expected = single_job_csvs(str(tmp_path / 'single'), monkeypatch)
+
+    monkeypatch.chdir(copy_outputs(str(tmp_path / 'manifest')))
+    jobs = [{'w': w, 'i': files, 'pol': pol, 'norm': norm, 'incoming_field_ev': energy, 'plot': False}
+            for w, files, pol, norm, energy, _ in JOBS]
+    for job, (_, _, _, _, _, name) in zip(jobs, JOBS):
+        if job['pol'] is None:
+            del job['pol']
+        if name:
+            job['name'] = name
+    with open('jobs.json', 'w') as f:
+        json.dump({'defaults': {'freqmin': 0, 'freqmax': 2000}, 'job': jobs}, f)
+
+    inp = input_class.input_class()
+    inp.manifest = True
+    inp.ams_file = 'jobs.json'
+    inp.conv_backend = 'direct'
+    inp.mem_budget = mem_budget   # 40000 bytes: one spectrum per conv_stick call, the rest spilled
+    capsys.readouterr()
+    manifest.run(inp)
+    report = capsys.readouterr().out
+
+    for csv, content in expected.items():
+        with open(csv) as f:
+            assert f.read() == content, csv
+
+    counts = {line.split('(')[0].strip(): line.split()[-2:] for line in report.splitlines() if '(' in line and 'requested' not in line}
+    assert counts['Parsing'] == ['6', '2']
+    assert counts['Correction'] == ['6', '3']
+    assert counts['Broadening'] == ['6', '3' if mem_budget == 0 else '6']
+    assert '6 distinct spectra broadened for 6 requested' in report
+# -------------------------------------------------------------------------------------
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functions import plotting
+
+
+# -------------------------------------------------------------------------------------
+def test_downsample_keeps_extrema_of_every_column_and_endpoints():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0.0, 4000.0, 100001)
+    y = np.cumsum(rng.standard_normal(len(x)))
+    n_columns = 300
+
+    x_kept, y_kept = plotting.downsample_m4(x, y, n_columns)
+    assert len(x_kept) <= 4 * n_columns
+    assert np.all(np.diff(x_kept) > 0)
+    assert (x_kept[0], y_kept[0]) == (x[0], y[0])
+    assert (x_kept[-1], y_kept[-1]) == (x[-1], y[-1])
+
+    # Same column assignment as the downsampler
+    column = np.minimum(((x - x[0]) / (x[-1] - x[0]) * n_columns).astype(int), n_columns - 1)
+    column_kept = np.minimum(((x_kept - x[0]) / (x[-1] - x[0]) * n_columns).astype(int), n_columns - 1)
+    for c in range(n_columns):
+        inside, kept = column == c, column_kept == c
+        assert y_kept[kept].min() == y[inside].min()
+        assert y_kept[kept].max() == y[inside].max()
+# -------------------------------------------------------------------------------------
+def test_downsample_returns_short_traces_unchanged():
+    n_columns = 50
+    x = np.linspace(0.0, 1.0, 4 * n_columns)
+    y = np.sin(40.0 * x)
+    x_kept, y_kept = plotting.downsample_m4(x, y, n_columns)
+    assert x_kept is x and y_kept is y
+# -------------------------------------------------------------------------------------
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes import spectrum_store
+
+N_POINTS = 100
+SPECTRUM_BYTES = N_POINTS * 8
+
+
+# -------------------------------------------------------------------------------------
+def spill_files(directory):
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(directory) for f in files)
+# -------------------------------------------------------------------------------------
+def test_no_budget_keeps_everything_in_memory(tmp_path):
+    store = spectrum_store.spectrum_store(0, str(tmp_path))
+    for k in range(5):
+        store.add(k, np.full(N_POINTS, float(k)))
+    assert store.n_spilled == 0 and store.in_memory == 5 * SPECTRUM_BYTES
+    assert spill_files(tmp_path) == []
+    store.close()
+# -------------------------------------------------------------------------------------
+def test_spectra_beyond_the_budget_are_memory_mapped(tmp_path):
+    store = spectrum_store.spectrum_store(SPECTRUM_BYTES, str(tmp_path))
+    first = store.add('a', np.arange(N_POINTS, dtype=float))
+    second = store.add('b', 2.0 * np.arange(N_POINTS))
+    assert not isinstance(first, np.memmap) and isinstance(second, np.memmap)
+    assert store.n_spilled == 1 and len(store) == 2 and 'b' in store
+    np.testing.assert_array_equal(store['b'], 2.0 * np.arange(N_POINTS))
+    assert len(spill_files(tmp_path)) == 1
+    store.close()
+# -------------------------------------------------------------------------------------
+def test_replacing_a_spilled_spectrum_removes_its_file(tmp_path):
+    store = spectrum_store.spectrum_store(SPECTRUM_BYTES, str(tmp_path))
+    store.add('a', np.zeros(N_POINTS))
+    store.add('b', np.ones(N_POINTS))
+    old_file = spill_files(tmp_path)[0]
+
+    store.add('b', store['b'] / 2.0)
+    assert store.n_spilled == 1
+    assert spill_files(tmp_path) != [old_file] and len(spill_files(tmp_path)) == 1
+    np.testing.assert_array_equal(store['b'], np.full(N_POINTS, 0.5))
+
+    # Replacing an in-memory spectrum releases its share of the budget first
+    store.add('a', np.ones(N_POINTS))
+    assert store.in_memory == SPECTRUM_BYTES and not isinstance(store['a'], np.memmap)
+
+    store.discard('b')
+    assert store.n_spilled == 0 and spill_files(tmp_path) == []
+    store.close()
+# -------------------------------------------------------------------------------------
+def test_stores_sharing_a_spill_dir_do_not_collide(tmp_path):
+    stores = [spectrum_store.spectrum_store(1, str(tmp_path)) for _ in range(2)]
+    for n, store in enumerate(stores):
+        store.add(0, np.full(N_POINTS, float(n)))
+    assert len(spill_files(tmp_path)) == 2
+    for n, store in enumerate(stores):
+        np.testing.assert_array_equal(store[0], np.full(N_POINTS, float(n)))
+    for store in stores:
+        store.close()
+# -------------------------------------------------------------------------------------
+def test_close_removes_the_spill_subdirectory(tmp_path):
+    store = spectrum_store.spectrum_store(1, str(tmp_path))
+    store.add(0, np.zeros(N_POINTS))
+    store.close()
+    assert os.listdir(tmp_path) == [] and len(store) == 0 and store.n_spilled == 0
+# -------------------------------------------------------------------------------------
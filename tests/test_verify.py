@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes import input_class
+from functions import broadening, verify
+
+
+# -------------------------------------------------------------------------------------
+def verify_input(**options):
+    """
+    Input of a short -w verify run on the bundled AMS output plus synthetic ones.
+    The backend is pinned so that no cost model is calibrated or written.
+    """
+    inp = input_class.input_class()
+    inp.verify = True
+    inp.ams_file = [os.path.join(ROOT, 'data', 'vac_proline_init.out')]
+    inp.freq_min = 500.0
+    inp.freq_max = 1700.0
+    inp.incoming_field_ev = 3.41
+    inp.n_synthetic = 3
+    inp.conv_backend = 'direct'
+    for key, value in options.items():
+        setattr(inp, key, value)
+    return inp
+# -------------------------------------------------------------------------------------
+def test_verify_passes():
+    verify.run(verify_input())
+# -------------------------------------------------------------------------------------
+def test_verify_detects_perturbed_backend(monkeypatch, capsys):
+    matrix = broadening.CONV_FUNCTIONS['matrix']
+
+    def perturbed(*args, **kwargs):
+        spectrum = matrix(*args, **kwargs)
+        spectrum *= 1.0 + 1.0e-9   # In place: chunked runs write into out
+        return spectrum
+
+    monkeypatch.setitem(broadening.CONV_FUNCTIONS, 'matrix', perturbed)
+    with pytest.raises(SystemExit) as exit_info:
+        verify.run(verify_input(n_synthetic=0), pipelines=False)
+    assert exit_info.value.code == 1
+
+    rows = [line.split() for line in capsys.readouterr().out.splitlines() if 'vac_proline_init.out' in line]
+    status = {(row[1], row[2]): row[-1] for row in rows}
+    assert status[('RAMAN', 'matrix')] == 'FAIL'
+    assert status[('ROA_back', 'matrix/4t')] == 'FAIL'
+    assert status[('RAMAN', 'direct')] == 'ok'
+    assert status[('ROA_back', 'direct/4t')] == 'ok'
+    assert status[('ROA_back', 'parser')] == 'ok'
+# -------------------------------------------------------------------------------------